@@ -0,0 +1,100 @@
+"""JOIN + DISTINCT vs EXISTS semi-join for campaign audience counts.
+
+Builds a synthetic crm_analysis / crm_sales pair in an in-memory SQLite
+database and, for a few typical Create Campaign filter sets, reports how many
+joined rows the old ``COUNT(DISTINCT)`` form has to de-duplicate against the
+customers the EXISTS form returns, plus the time of each query.
+
+    python benchmarks/audience_semijoin.py [customers] [avg_lines_per_customer]
+"""
+import random
+import sqlite3
+import sys
+import time
+
+BRANDS = [f"BRAND{i}" for i in range(20)]
+SECTIONS = [f"SEC{i}" for i in range(8)]
+PRODUCTS = [f"PROD{i}" for i in range(40)]
+STATES = ["KA", "TN", "KL", "AP", "TS"]
+
+FILTER_SETS = [
+    ("no product filter", ["a.LAST_IN_STORE_STATE = 'TN'"], []),
+    ("brand", ["a.R_SCORE IN (4, 5)"], ["s.BRAND = 'BRAND3'"]),
+    ("brand + section", [], ["s.BRAND = 'BRAND3'", "s.SECTION IN ('SEC1', 'SEC2')"]),
+    ("brand + value", ["a.LAST_IN_STORE_STATE IN ('KA', 'KL')"], ["s.BRAND = 'BRAND7'", "s.TOTAL_SALES >= 20000"]),
+]
+
+
+def build(conn, customers: int, avg_lines: int):
+    rnd = random.Random(42)
+    conn.executescript("""
+        CREATE TABLE crm_analysis (
+            CUST_MOBILENO TEXT PRIMARY KEY, R_SCORE INT, LAST_IN_STORE_STATE TEXT
+        );
+        CREATE TABLE crm_sales (
+            CUST_MOBILENO TEXT, BRAND TEXT, SECTION TEXT, PRODUCT TEXT,
+            TOTAL_SALES NUMERIC, INVOICE_DATE TEXT
+        );
+    """)
+    conn.executemany(
+        "INSERT INTO crm_analysis VALUES (?, ?, ?)",
+        ((f"9{i:09d}", rnd.randint(1, 5), rnd.choice(STATES)) for i in range(customers)),
+    )
+    conn.executemany(
+        "INSERT INTO crm_sales VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (f"9{i:09d}", rnd.choice(BRANDS), rnd.choice(SECTIONS), rnd.choice(PRODUCTS),
+             rnd.randint(100, 50000), f"2024-{rnd.randint(1, 12):02d}-01")
+            for i in range(customers)
+            for _ in range(rnd.randint(1, 2 * avg_lines - 1))
+        ),
+    )
+    conn.executescript("""
+        CREATE INDEX ix_sales_customer ON crm_sales (CUST_MOBILENO, BRAND, SECTION);
+        CREATE INDEX ix_sales_brand ON crm_sales (BRAND, SECTION, CUST_MOBILENO);
+        ANALYZE;
+    """)
+
+
+def timed(conn, sql: str):
+    started = time.perf_counter()
+    value = conn.execute(sql).fetchone()[0]
+    return value, (time.perf_counter() - started) * 1000
+
+
+def main():
+    customers = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    avg_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    conn = sqlite3.connect(":memory:")
+    build(conn, customers, avg_lines)
+    lines = conn.execute("SELECT COUNT(*) FROM crm_sales").fetchone()[0]
+    print(f"{customers} customers, {lines} sales lines\n")
+    print(f"{'filters':<20}{'joined rows':>14}{'customers':>12}{'reduction':>11}{'join ms':>10}{'exists ms':>11}")
+
+    for label, analysis, sales in FILTER_SETS:
+        join_where = " AND ".join(analysis + sales) or "1=1"
+        join_from = "FROM crm_sales s JOIN crm_analysis a ON a.CUST_MOBILENO = s.CUST_MOBILENO"
+        joined_rows = conn.execute(f"SELECT COUNT(*) {join_from} WHERE {join_where}").fetchone()[0]
+        join_count, join_ms = timed(conn, f"SELECT COUNT(DISTINCT a.CUST_MOBILENO) {join_from} WHERE {join_where}")
+
+        exists_where = list(analysis)
+        if sales:
+            exists_where.append(
+                "EXISTS (SELECT 1 FROM crm_sales s WHERE s.CUST_MOBILENO = a.CUST_MOBILENO AND "
+                + " AND ".join(sales) + ")"
+            )
+        exists_count, exists_ms = timed(
+            conn, f"SELECT COUNT(*) FROM crm_analysis a WHERE {' AND '.join(exists_where) or '1=1'}"
+        )
+
+        assert join_count == exists_count, (label, join_count, exists_count)
+        reduction = joined_rows / exists_count if exists_count else float("inf")
+        print(
+            f"{label:<20}{joined_rows:>14}{exists_count:>12}{reduction:>10.1f}x"
+            f"{join_ms:>10.1f}{exists_ms:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Campaign audience filters → SQLAlchemy Core statements.
+
+All audience queries (run count, run details, number download) describe
+their filters as one canonical dict and get their statement from
+:func:`compile_audience`:
+
+* crm_analysis drives every statement, so each customer appears once;
+* product filters become one EXISTS semi-join against crm_customer_product
+  (or crm_sales when a purchase window is given, since the facts carry no
+  per-line dates, or when the fact table is not yet refreshed for the current
+  data version) and are skipped entirely when absent;
+* ``either`` holds alternative groups of crm_analysis filters that are OR-ed
+  (a campaign's segments OR its R/F/M criteria);
+* all values are bind parameters (IN lists use expanding binds), so a
+  statement depends only on the filter *shape* – which keys are present and
+  which range operators are used.  Statements are cached per shape and their
+  compiled form is reused by SQLAlchemy's compiled cache.
+
+Output modes: ``count`` (one COUNT(*)), ``ids`` (mobile numbers), ``rows``
+(mobile, name, segment) and ``facets`` (customers per value of one dimension,
+or – with no facet – per combination of all of them, for one-scan breakdowns).
+"""
+import threading
+
+from sqlalchemy import Date, Numeric, String, and_, bindparam, column, exists, func, or_, select, table
+
+from controllers.campaign.customer_product import customer_products_ready
+from models.crm_analysis import CRMAnalysis as CRMAnalysisModel
+from models.customer_product import CRMCustomerProduct
+from utils.data_version import get_data_version
+
+MODES = ("count", "ids", "rows", "facets")
+
+_analysis = CRMAnalysisModel.__table__
+_facts = CRMCustomerProduct.__table__
+# crm_sales has no ORM model; only the columns audience filters touch
+_sales = table(
+    "crm_sales",
+    column("CUST_MOBILENO", String),
+    column("BRAND", String),
+    column("SECTION", String),
+    column("PRODUCT", String),
+    column("MODELNO", String),
+    column("ITEM_CODE", String),
+    column("ITEM_DESCRIPTION", String),
+    column("TOTAL_SALES", Numeric),
+    column("INVOICE_DATE", Date),
+)
+
+# canonical key → crm_analysis column matched with IN (...)
+ANALYSIS_IN = {
+    "mobile": "CUST_MOBILENO",
+    "branch": "LAST_IN_STORE_CODE",
+    "branch_name": "LAST_IN_STORE_NAME",
+    "city": "LAST_IN_STORE_CITY",
+    "state": "LAST_IN_STORE_STATE",
+    "segment": "SEGMENT_MAP",
+    "r_score": "R_SCORE",
+    "f_score": "F_SCORE",
+    "m_score": "M_SCORE",
+}
+# canonical key → crm_analysis column for (op, low, high) range filters
+ANALYSIS_RANGE = {"recency": "DAYS", "frequency": "F_VALUE", "monetary": "M_VALUE"}
+# canonical key → crm_analysis date column for (start, end) filters
+ANALYSIS_DATES = {"birthday": "DOB", "anniversary": "ANNIV_DT"}
+# canonical key → purchase column matched with IN (...)
+PURCHASE_IN = {
+    "brand": "BRAND",
+    "section": "SECTION",
+    "product": "PRODUCT",
+    "model": "MODELNO",
+    "item": "ITEM_CODE",
+    "item_description": "ITEM_DESCRIPTION",
+}
+RANGE_OPS = (">=", "<=", "=", "between")
+# dimensions a facets statement can group by
+FACET_COLUMNS = {key: ANALYSIS_IN[key] for key in ("segment", "branch", "city", "state", "r_score", "f_score", "m_score")}
+
+_statements: dict = {}
+_lock = threading.Lock()
+
+
+def _present(value) -> bool:
+    return value is not None and value != "" and value != [] and value != ()
+
+
+def _range(op, low, high):
+    """Normalise a UI range to (op, low, high) or None when incomplete."""
+    if op not in RANGE_OPS or low is None:
+        return None
+    if op == "between":
+        return (op, low, high) if high is not None else None
+    return (op, low, None)
+
+
+def _shape_parts(filters: dict) -> tuple:
+    parts = []
+    for key in sorted(filters):
+        value = filters[key]
+        if key in ANALYSIS_RANGE:
+            parts.append((key, value[0]))
+        elif key == "either":
+            parts.append((key, tuple(_shape_parts(group) for group in value)))
+        else:
+            parts.append((key,))
+    return tuple(parts)
+
+
+def _shape(filters: dict, mode: str, facet: str | None, facts: bool) -> tuple:
+    return (mode, facet, facts, _shape_parts(filters))
+
+
+def _analysis_where(filters: dict, prefix: str = "") -> list:
+    """crm_analysis predicates for ``filters``; bind names are prefixed for OR groups."""
+    a = _analysis.c
+    where = []
+    for key, name in ANALYSIS_IN.items():
+        if key in filters:
+            where.append(a[name].in_(bindparam(f"{prefix}{key}", expanding=True)))
+    for key, name in ANALYSIS_RANGE.items():
+        if key in filters:
+            op = filters[key][0]
+            col = a[name]
+            low = bindparam(f"{prefix}{key}_low")
+            if op == "between":
+                where.append(col.between(low, bindparam(f"{prefix}{key}_high")))
+            elif op == ">=":
+                where.append(col >= low)
+            elif op == "<=":
+                where.append(col <= low)
+            else:
+                where.append(col == low)
+    for key, name in ANALYSIS_DATES.items():
+        if key in filters:
+            where.append(a[name].between(bindparam(f"{prefix}{key}_start"), bindparam(f"{prefix}{key}_end")))
+    return where
+
+
+def _analysis_params(filters: dict, params: dict, prefix: str = ""):
+    for key, value in filters.items():
+        if key in ANALYSIS_IN:
+            params[f"{prefix}{key}"] = list(value)
+        elif key in ANALYSIS_RANGE:
+            _, params[f"{prefix}{key}_low"], high = value
+            if high is not None:
+                params[f"{prefix}{key}_high"] = high
+        elif key in ANALYSIS_DATES:
+            params[f"{prefix}{key}_start"], params[f"{prefix}{key}_end"] = value
+
+
+def _build(filters: dict, mode: str, facet: str | None, facts: bool):
+    a = _analysis.c
+    where = _analysis_where(filters)
+    if "either" in filters:
+        # customers matching at least one group of analysis filters
+        where.append(or_(*(
+            and_(*_analysis_where(group, f"either{i}_")) for i, group in enumerate(filters["either"])
+        )))
+
+    # product predicates: one semi-join, only when there is something to test
+    window = "purchase_window" in filters
+    source = _facts if facts and not window else _sales
+    # per line on crm_sales; the facts keep each customer/path's largest line
+    value_column = source.c.MAX_LINE_SALES if source is _facts else source.c.TOTAL_SALES
+    purchase = [source.c[name].in_(bindparam(key, expanding=True)) for key, name in PURCHASE_IN.items() if key in filters]
+    if "value_threshold" in filters:
+        purchase.append(value_column >= bindparam("value_threshold"))
+    if window:
+        purchase.append(source.c.INVOICE_DATE.between(bindparam("window_start"), bindparam("window_end")))
+    if purchase:
+        where.append(exists().where(source.c.CUST_MOBILENO == a.CUST_MOBILENO, *purchase))
+
+    if mode == "count":
+        stmt = select(func.count().label("cnt")).select_from(_analysis)
+    elif mode == "ids":
+        stmt = select(a.CUST_MOBILENO)
+    elif mode == "rows":
+        stmt = select(
+            a.CUST_MOBILENO,
+            a.CUSTOMER_NAME.label("customer_name"),
+            a.SEGMENT_MAP.label("segment_map"),
+        )
+    elif facet is not None:
+        dim = a[FACET_COLUMNS[facet]]
+        stmt = select(dim.label("value"), func.count().label("customers")).group_by(dim)
+    else:
+        dims = [a[name] for name in FACET_COLUMNS.values()]
+        labelled = [dim.label(key) for key, dim in zip(FACET_COLUMNS, dims)]
+        stmt = select(*labelled, func.count().label("customers")).group_by(*dims)
+    return stmt.where(and_(*where)) if where else stmt
+
+
+def compile_audience(filters: dict, mode: str = "count", facet: str | None = None):
+    """Return ``(statement, params)`` for canonical ``filters`` in output ``mode``."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown audience mode: {mode}")
+    if mode == "facets" and facet is not None and facet not in FACET_COLUMNS:
+        raise ValueError(f"Unknown facet: {facet}")
+
+    filters = {k: v for k, v in filters.items() if _present(v)}
+    if "either" in filters:
+        groups = tuple({k: v for k, v in group.items() if _present(v)} for group in filters["either"])
+        if all(groups):
+            filters["either"] = groups
+        else:
+            del filters["either"]  # an unrestricted alternative matches everyone
+    # until the fact table is current for this data version, read crm_sales
+    facts = customer_products_ready(get_data_version())
+    key = _shape(filters, mode, facet, facts)
+    with _lock:
+        stmt = _statements.get(key)
+    if stmt is None:
+        stmt = _build(filters, mode, facet, facts)
+        with _lock:
+            _statements[key] = stmt
+
+    params = {}
+    _analysis_params(filters, params)
+    for i, group in enumerate(filters.get("either", ())):
+        _analysis_params(group, params, f"either{i}_")
+    for key_, value in filters.items():
+        if key_ in PURCHASE_IN:
+            params[key_] = list(value)
+        elif key_ == "purchase_window":
+            params["window_start"], params["window_end"] = value
+        elif key_ == "value_threshold":
+            params[key_] = value
+    return stmt, params
+
+
+# --- Canonical filters from each caller's payload ---
+def from_run_request(filters: dict) -> dict:
+    """CampaignRunFilters (``model_dump``) → canonical filters."""
+    canonical = {key: filters.get(key) for key in ("branch", "city", "state", "r_score", "f_score", "m_score")}
+    canonical.update({key: filters.get(key) for key in ("section", "product", "model", "item")})
+    if filters.get("brand"):
+        canonical["brand"] = [filters["brand"]]
+    canonical["value_threshold"] = filters.get("value_threshold")
+    for key in ANALYSIS_RANGE:
+        canonical[key] = _range(filters.get(f"{key}_op"), filters.get(f"{key}_min"), filters.get(f"{key}_max"))
+    for key in ANALYSIS_DATES:
+        start, end = filters.get(f"{key}_start"), filters.get(f"{key}_end")
+        canonical[key] = (start, end) if start and end else None
+    return canonical
+
+
+def from_download_filters(filters) -> dict:
+    """NumberDownloadFilters → canonical filters (branch is the store name here)."""
+    def get(name):
+        return getattr(filters, name, None)
+
+    return {
+        "brand": get("purchaseBrand"),
+        "section": get("section"),
+        "product": get("product"),
+        "model": get("model"),
+        "item": get("item"),
+        "value_threshold": get("valueThreshold"),
+        "branch_name": get("branch"),
+        "city": get("city"),
+        "state": get("state"),
+        "segment": get("rfmSegment"),
+        "r_score": get("rScore"),
+        "recency": _range(get("recencyOp"), get("recencyMin"), get("recencyMax")),
+        "frequency": _range(get("frequencyOp"), get("frequencyMin"), get("frequencyMax")),
+        "monetary": _range(get("monetaryOp"), get("monetaryMin"), get("monetaryMax")),
+    }
+
+
+def _as_list(value):
+    """A saved JSON filter as a list (a bare value or a {"label": ..} dict → one item)."""
+    if value is None or isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        return [value["label"]] if value.get("label") is not None else None
+    return [value]
+
+
+def from_campaign_eligibility(camp) -> dict:
+    """Saved Campaign → canonical filters for its sends.
+
+    Eligible customers match its RFM segments OR its R/F/M criteria (score
+    lists, and recency/frequency/monetary ranges when both bounds are set),
+    inside its geography and product filters; product item is matched on the
+    item description.  An empty selection does not restrict.
+    """
+    segments = {"segment": _as_list(camp.rfm_segments)}
+    rfm = {
+        "r_score": _as_list(camp.r_score),
+        "f_score": _as_list(camp.f_score),
+        "m_score": _as_list(camp.m_score),
+    }
+    for key, low, high in (
+        ("recency", camp.recency_min, camp.recency_max),
+        ("frequency", camp.frequency_min, camp.frequency_max),
+        ("monetary", camp.monetary_min, camp.monetary_max),
+    ):
+        rfm[key] = _range("between", low, high)
+
+    canonical = {
+        "branch": _as_list(camp.branch),
+        "city": _as_list(camp.city),
+        "state": _as_list(camp.state),
+        "section": _as_list(camp.section),
+        "product": _as_list(camp.product),
+        "model": _as_list(camp.model),
+        "item_description": _as_list(camp.item),
+        "either": (segments, rfm),
+    }
+    # with only one side selected the OR reduces to that side
+    if not any(_present(v) for v in segments.values()):
+        del canonical["either"]
+        canonical.update(rfm)
+    elif not any(_present(v) for v in rfm.values()):
+        del canonical["either"]
+        canonical.update(segments)
+    return canonical
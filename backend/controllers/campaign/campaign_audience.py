@@ -0,0 +1,146 @@
+"""Frozen campaign audiences (``campaign_audience``).
+
+A campaign run resolves its eligible customers once, with a single
+``INSERT ... SELECT`` of the eligibility query from the audience compiler
+(see ``from_campaign_eligibility``), stamped with the current data version, and every send,
+export and count for that run reads the frozen rows.  The sends therefore
+cost a primary-key range read instead of re-running the eligibility query,
+and all reads against one data version see the same customers.  The first
+read freezes automatically, as does the first read after a data reload (the
+stamp no longer matches); ``freeze_campaign_audience`` re-freezes on demand
+and editing the campaign drops the frozen set.
+"""
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, String, func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.campaign.campaign_audience_model import CampaignAudience, CampaignAudienceFreeze
+from models.campaign.campaign_model import Campaign
+from controllers.campaign.audience_compiler import compile_audience, from_campaign_eligibility
+from utils.data_version import get_data_version
+
+_audience = CampaignAudience.__table__
+
+
+def eligible_customers_statement(camp: Campaign):
+    """``(statement, params)`` selecting the distinct mobile numbers a campaign sends to."""
+    return compile_audience(from_campaign_eligibility(camp), "ids")
+
+
+def count_eligible_customers(db: Session, camp: Campaign) -> int:
+    """How many customers a freeze of the campaign would store right now."""
+    stmt, params = compile_audience(from_campaign_eligibility(camp), "count")
+    return int(db.execute(stmt, params).scalar() or 0)
+
+
+def _freeze_info(freeze: CampaignAudienceFreeze) -> dict:
+    return {
+        "campaign_id": freeze.campaign_id,
+        "customers": freeze.customers,
+        "snapshot_version": freeze.snapshot_version,
+        "frozen_at": freeze.frozen_at,
+    }
+
+
+def _is_current(db: Session, freeze: CampaignAudienceFreeze) -> bool:
+    return freeze.snapshot_version == get_data_version(db)
+
+
+def _write_audience(db: Session, camp: Campaign, freeze: CampaignAudienceFreeze):
+    version = get_data_version(db)
+    db.query(CampaignAudience).filter(CampaignAudience.campaign_id == freeze.campaign_id).delete()
+    eligible, params = eligible_customers_statement(camp)
+    eligible = eligible.subquery()
+    db.execute(
+        insert(_audience).from_select(
+            ["campaign_id", "CUST_MOBILENO", "snapshot_version"],
+            select(
+                literal(freeze.campaign_id, Integer),
+                eligible.c.CUST_MOBILENO,
+                literal(version, String),
+            ).where(eligible.c.CUST_MOBILENO.is_not(None)),
+        ),
+        params,
+    )
+    freeze.customers = db.execute(
+        select(func.count()).where(CampaignAudience.campaign_id == freeze.campaign_id)
+    ).scalar()
+    freeze.snapshot_version = version
+    freeze.frozen_at = datetime.now()
+
+
+def freeze_campaign_audience(db: Session, campaign_id: int, only_if_stale: bool = False) -> dict:
+    """Resolve the campaign's eligible customers now and store them as its run audience.
+
+    With ``only_if_stale`` an audience already frozen for the current data
+    version (e.g. by a concurrent request) is kept.
+    """
+    camp = db.get(Campaign, campaign_id)
+    if camp is None:
+        raise HTTPException(404, "Campaign not found")
+    freeze = (
+        db.query(CampaignAudienceFreeze)
+        .filter(CampaignAudienceFreeze.campaign_id == campaign_id)
+        .with_for_update()
+        .first()
+    )
+    if freeze is None:
+        freeze = CampaignAudienceFreeze(campaign_id=campaign_id)
+        db.add(freeze)
+    elif only_if_stale and _is_current(db, freeze):
+        db.commit()
+        return _freeze_info(freeze)
+    _write_audience(db, camp, freeze)
+    db.commit()
+    return _freeze_info(freeze)
+
+
+def ensure_campaign_audience(db: Session, campaign_id: int) -> dict:
+    """The campaign's frozen audience info, (re)freezing it first if it is missing or
+    was frozen from an older data version."""
+    freeze = db.get(CampaignAudienceFreeze, campaign_id)
+    if freeze is not None and _is_current(db, freeze):
+        return _freeze_info(freeze)
+    try:
+        return freeze_campaign_audience(db, campaign_id, only_if_stale=True)
+    except IntegrityError:
+        # another request froze it first; use theirs
+        db.rollback()
+        return _freeze_info(db.get(CampaignAudienceFreeze, campaign_id))
+
+
+def get_campaign_audience_info(db: Session, campaign_id: int) -> dict | None:
+    """Frozen audience info, or None if the campaign has not been frozen.
+
+    ``current`` is False once the data has been reloaded since the freeze;
+    the next send or export re-freezes it.
+    """
+    freeze = db.get(CampaignAudienceFreeze, campaign_id)
+    if freeze is None:
+        return None
+    return {**_freeze_info(freeze), "current": _is_current(db, freeze)}
+
+
+def campaign_audience_numbers_statement(campaign_id: int):
+    """SELECT of the frozen audience's mobile numbers, in primary-key order."""
+    return (
+        select(CampaignAudience.CUST_MOBILENO)
+        .where(CampaignAudience.campaign_id == campaign_id)
+        .order_by(CampaignAudience.CUST_MOBILENO)
+    )
+
+
+def get_campaign_audience_numbers(db: Session, campaign_id: int) -> list[str]:
+    """Mobile numbers of the campaign's frozen audience (freezing it if needed)."""
+    ensure_campaign_audience(db, campaign_id)
+    rows = db.execute(campaign_audience_numbers_statement(campaign_id))
+    return [mobile for (mobile,) in rows]
+
+
+def drop_campaign_audience(db: Session, campaign_id: int):
+    """Forget a frozen audience (the campaign's filters changed). Caller commits."""
+    db.query(CampaignAudience).filter(CampaignAudience.campaign_id == campaign_id).delete()
+    db.query(CampaignAudienceFreeze).filter(CampaignAudienceFreeze.campaign_id == campaign_id).delete()
@@ -1,22 +1,50 @@
-import csv
 from decimal import Decimal
-from io import BytesIO, StringIO
-from fastapi.responses import StreamingResponse
+from typing import Iterator
+from io import BytesIO
 import pandas as pd
 import math
+import os
+import random
+import threading
 from fastapi import HTTPException
-from sqlalchemy.dialects import mysql
-from sqlalchemy import text
+from sqlalchemy import func, select, text
 from sqlalchemy.orm import Session
 from models.campaign.campaign_model import Campaign
 from models.campaign.upload_contact_model import CampaignUpload
 from models.campaign.brand_detail_model import  BrandDetail
-from models.campaign.brand_filter_model import CampaignBrandFilter
 from models.campaign.geography_model import Geography
 from models.campaign.rfm_detail_model import RFMDetail
-from schemas.campaign.campaign_schema import CampaignCreate
 from models.crm_analysis import CRMAnalysis as CRMAnalysisModel
-from schemas.crm_analysis import CRMAnalysis as CRMAnalysisSchema
+from controllers.campaign.audience_compiler import (
+    FACET_COLUMNS,
+    compile_audience,
+    from_download_filters,
+    from_run_request,
+)
+from controllers.campaign.campaign_audience import (
+    campaign_audience_numbers_statement,
+    count_eligible_customers,
+    drop_campaign_audience,
+    ensure_campaign_audience,
+    get_campaign_audience_info,
+)
+from controllers.campaign.campaign_filter_values import sync_campaign_filter_values
+from controllers.campaign.customer_product import customer_products_ready
+from utils.audience_bitmaps import get_audience_index
+from utils.audience_sketches import get_audience_sketches
+from utils.brand_tree import get_brand_tree
+from utils.crm_snapshot import get_snapshot
+from utils.data_version import get_data_version, on_data_reload
+from utils.db_stream import RowStream, stream_chunks
+from utils.flight_cache import SingleFlightCache, canonical_key
+from utils.query_budget import (
+    COUNT_BUDGET_MS,
+    ESTIMATE_BUDGET_MS,
+    QueryCancelled,
+    QueryTimeout,
+    execute_budgeted,
+)
+from utils.xlsx_stream import stream_xlsx
 
 #from schemas.campaign.campaign_schema import CampaignOptions
 # from schemas.campaign.campaign_schema import CampaignCreate, CampaignOptions
@@ -31,139 +59,112 @@ def _to_float(x):
         return None
     return float(x) if isinstance(x, (int, float, Decimal)) else x
 
-def get_campaign_options(db: Session) -> CampaignOptions:
-    # 1. RFM details
-    # r_scores     = [r[0] for r in db.query(RFMDetail.r_score).distinct().order_by(RFMDetail.r_score)]
-    # f_scores     = [r[0] for r in db.query(RFMDetail.f_score).distinct().order_by(RFMDetail.f_score)]
-    # m_scores     = [r[0] for r in db.query(RFMDetail.m_score).distinct().order_by(RFMDetail.m_score)]
-    # segments     = [r[0] for r in db.query(RFMDetail.segment).distinct().order_by(RFMDetail.segment)]
-
-     # 1. RFM details – now pulled from crm_analysis
-    r_scores = [
-        row[0]
-        for row in db
-            .query(CRMAnalysisModel.R_SCORE)
-            .distinct()
-            .order_by(CRMAnalysisModel.R_SCORE)
-            .all()
-    ]
-    f_scores = [
-        row[0]
-        for row in db
-            .query(CRMAnalysisModel.F_SCORE)
-            .distinct()
-            .order_by(CRMAnalysisModel.F_SCORE)
-            .all()
-    ]
-    m_scores = [
-        row[0]
-        for row in db
-            .query(CRMAnalysisModel.M_SCORE)
-            .distinct()
-            .order_by(CRMAnalysisModel.M_SCORE)
-            .all()
-    ]
-    segments = [
-        row[0]
-        for row in db
-            .query(CRMAnalysisModel.SEGMENT_MAP)
-            .distinct()
-            .order_by(CRMAnalysisModel.SEGMENT_MAP)
-            .all()
-    ]
+# --- Campaign options ---
+# Built once per data version; opening the Create Campaign screen then costs nothing.
+_options_cache = {"version": None, "options": None}
+_options_lock = threading.Lock()
+
 
-    # 2. Geography: branch → cities, states
-    # geo_rows     = db.query(Geography.branch, Geography.city, Geography.state).all()
-    # branches     = sorted({g.branch for g in geo_rows})
-    # branch_city  = {}
-    # branch_state = {}
-    # for b, c, s in geo_rows:
-    #     branch_city.setdefault(b, set()).add(c)
-    #     branch_state.setdefault(b, set()).add(s)
-    # branch_city_map  = {b: sorted(list(cs)) for b, cs in branch_city.items()}
-    # branch_state_map = {b: sorted(list(ss)) for b, ss in branch_state.items()}
-
-    # 2. Geography: branch → cities, states (from crm_analysis)
-    geo_rows = (
+@on_data_reload
+def _clear_options_cache(version):
+    with _options_lock:
+        _options_cache["version"] = _options_cache["options"] = None
+
+
+def get_campaign_options(db: Session) -> CampaignOptions:
+    """Filter choices for the Create Campaign screen, cached until the next data load."""
+    version = get_data_version(db)
+    with _options_lock:
+        if _options_cache["options"] is not None and _options_cache["version"] == version:
+            return _options_cache["options"]
+
+    options = _build_campaign_options(db)
+    with _options_lock:
+        _options_cache["version"], _options_cache["options"] = version, options
+    return options
+
+
+def _build_campaign_options(db: Session) -> CampaignOptions:
+    # 1 + 2. RFM scores, segments and branch → city/state from one grouped pass
+    # over crm_analysis; each distinct combination is visited once.
+    r_scores, f_scores, m_scores, segments = set(), set(), set(), set()
+    branch_cities: dict = {}
+    branch_states: dict = {}
+    combos = (
         db.query(
+            CRMAnalysisModel.R_SCORE,
+            CRMAnalysisModel.F_SCORE,
+            CRMAnalysisModel.M_SCORE,
+            CRMAnalysisModel.SEGMENT_MAP,
+            CRMAnalysisModel.LAST_IN_STORE_NAME,
+            CRMAnalysisModel.LAST_IN_STORE_CITY,
+            CRMAnalysisModel.LAST_IN_STORE_STATE,
+        )
+        .group_by(
+            CRMAnalysisModel.R_SCORE,
+            CRMAnalysisModel.F_SCORE,
+            CRMAnalysisModel.M_SCORE,
+            CRMAnalysisModel.SEGMENT_MAP,
             CRMAnalysisModel.LAST_IN_STORE_NAME,
             CRMAnalysisModel.LAST_IN_STORE_CITY,
             CRMAnalysisModel.LAST_IN_STORE_STATE,
         )
-        .distinct()
-        .all()
     )
+    for r, f, m, segment, branch, city, state in combos:
+        # NULLs are left out: the option lists are typed int / str
+        if r is not None:
+            r_scores.add(r)
+        if f is not None:
+            f_scores.add(f)
+        if m is not None:
+            m_scores.add(m)
+        if segment is not None:
+            segments.add(segment)
+        if branch:
+            cities = branch_cities.setdefault(branch, set())
+            states = branch_states.setdefault(branch, set())
+            if city:
+                cities.add(city)
+            if state:
+                states.add(state)
+
+    branches = sorted(branch_cities)
+    branch_city_map = {b: sorted(branch_cities[b]) for b in branches}
+    branch_state_map = {b: sorted(branch_states[b]) for b in branches}
+
+    # 3. Brand levels; the full hierarchy is served level by level via get_brand_cascade
+    levels = get_brand_tree(db).cascade({})
 
-    branches = sorted({row[0] for row in geo_rows if row[0]})
-    branch_city_map = {
-        b: sorted({city for branch, city, _ in geo_rows if branch == b and city})
-        for b in branches
-    }
-    branch_state_map = {
-        b: sorted({state for branch, _, state in geo_rows if branch == b and state})
-        for b in branches
-    }
-
-    # # 3. Brand details: section, product, model, item
-    # bd_rows      = db.query(
-    #                   BrandDetail.section,
-    #                   BrandDetail.product,
-    #                   BrandDetail.model,
-    #                   BrandDetail.item
-    #                ).all()
-    # 3. Brand hierarchy: brand → section → product → model → item
-    bd_rows = db.query(
-        CampaignBrandFilter.brand,
-        CampaignBrandFilter.section,
-        CampaignBrandFilter.product,
-        CampaignBrandFilter.model,
-        CampaignBrandFilter.item,
-    ).all()
-   # brands = sorted({r.brand for r in bd_rows})
-    brands   = sorted({r.brand   for r in bd_rows if r.brand   is not None})
-    sections = sorted({r.section for r in bd_rows if r.section is not None})
-    products = sorted({r.product for r in bd_rows if r.product is not None})
-    models   = sorted({r.model   for r in bd_rows if r.model   is not None})
-    items    = sorted({r.item    for r in bd_rows if r.item    is not None})
-
-    # ✅ NEW: full hierarchy objects (filter out completely empty rows)
-    brand_hierarchy = [
-        {
-            "brand":   r.brand,
-            "section": r.section,
-            "product": r.product,
-            "model":   r.model,
-            "item":    r.item,
-        }
-        for r in bd_rows
-        if any([r.brand, r.section, r.product, r.model, r.item])
-    ]
-   
-   # print("brand_hierarchy------------",brand_hierarchy)
     return CampaignOptions(
-      r_scores=r_scores,
-      f_scores=f_scores,
-      m_scores=m_scores,
-      rfm_segments=segments,
+      r_scores=sorted(r_scores),
+      f_scores=sorted(f_scores),
+      m_scores=sorted(m_scores),
+      rfm_segments=sorted(segments),
 
       branches=branches,
       branch_city_map=branch_city_map,
       branch_state_map=branch_state_map,
-      
-
-      brands=brands,
-      sections=sections,
-      products=products,
-      models=models,
-      items=items,
-      brand_hierarchy=brand_hierarchy,
+
+      brands=levels["brand"],
+      sections=levels["section"],
+      products=levels["product"],
+      models=levels["model"],
+      items=levels["item"],
     )
 
+
+def get_brand_cascade(db: Session, selected: dict) -> dict:
+    """Valid brand/section/product/model/item values under the selected ancestors."""
+    levels = get_brand_tree(db).cascade(selected)
+    return {f"{level}s": values for level, values in levels.items()}
+
 def create_campaign(db: Session, data: CampaignCreate) -> Campaign:
     print("inside create campaign -----------------", data.dict(by_alias=False, exclude_unset=True))
     db_obj = Campaign(**data.dict(by_alias=False))
     
     db.add(db_obj)
+    db.flush()
+    sync_campaign_filter_values(db, db_obj)
     db.commit()
     db.refresh(db_obj)
     return db_obj
@@ -183,6 +184,9 @@ def update_campaign(db: Session, campaign_id: int, data: CampaignCreate):
         return None
     for field, value in data.dict().items():
         setattr(campaign, field, value)
+    sync_campaign_filter_values(db, campaign)
+    # the filters may have changed, so the next run freezes a new audience
+    drop_campaign_audience(db, campaign_id)
     db.commit()
     db.refresh(campaign)
     return campaign
@@ -228,22 +232,15 @@ def save_upload_contacts(db: Session, campaign_id: int, contacts: list[dict]):
         db.bulk_save_objects(objs)
         db.commit()
 
-def export_upload_contacts(db: Session, campaign_id: int) -> BytesIO:
-    rows = (
-        db.query(CampaignUpload)
-        .filter(CampaignUpload.campaign_id == campaign_id)
-        .all()
-    )
-    df = pd.DataFrame(
-        [
-            {"name": r.name, "mobile_no": r.mobile_no, "email_id": r.email_id}
-            for r in rows
-        ]
+def export_upload_contacts(db: Session, campaign_id: int) -> Iterator[bytes]:
+    """Uploaded contacts as a streamed .xlsx (read with a server-side cursor)."""
+    stmt = (
+        select(CampaignUpload.name, CampaignUpload.mobile_no, CampaignUpload.email_id)
+        .where(CampaignUpload.campaign_id == campaign_id)
+        .order_by(CampaignUpload.mobile_no)
     )
-    buffer = BytesIO()
-    df.to_excel(buffer, index=False)
-    buffer.seek(0)
-    return buffer
+    chunks = (rows for _, rows in stream_chunks(stmt))
+    return stream_xlsx(["name", "mobile_no", "email_id"], chunks, sheet_name="Contacts")
 
 
 def generate_upload_template() -> BytesIO:
@@ -353,183 +350,33 @@ def get_campaign_run_details11(db: Session, campaign_id: int) -> CampaignRunDeta
         shortlisted_count=shortlisted_count,
     )
 
-def export_crm_numbers(db: Session, campaign_id: int) -> BytesIO:
-    """Export distinct phone numbers from crm_sales for a campaign."""
+def export_crm_numbers(db: Session, campaign_id: int) -> Iterator[bytes]:
+    """Export the phone numbers of a campaign's frozen run audience as a streamed .xlsx."""
     camp: Campaign = db.query(Campaign).get(campaign_id)
     if not camp:
         raise HTTPException(404, "Campaign not found")
 
-    sql_numbers = text(
-        """
-        SELECT s.CUST_MOBILENO AS mobile_no
-        FROM crm_sales s
-        """
-    )
+    # freeze before the response starts; the rows are then read with a server-side cursor
+    ensure_campaign_audience(db, campaign_id)
+    chunks = (rows for _, rows in stream_chunks(campaign_audience_numbers_statement(campaign_id)))
+    return stream_xlsx(["mobile_no"], chunks, sheet_name="Numbers")
 
-    rows = db.execute(sql_numbers).fetchall()
-    df = pd.DataFrame([{"mobile_no": r.mobile_no} for r in rows])
+def get_mobile_numbers(filters) -> RowStream:
+    """Unstarted stream of mobile number, name and segment rows for the download filters.
 
-    buffer = BytesIO()
-    df.to_excel(buffer, index=False)
-    buffer.seek(0)
-    return buffer
-
-def get_mobile_numbers(db: Session, filters) -> list[str]:
-    """Fetch mobile numbers based on provided campaign filters.
-    Filters tied to product hierarchy (brand/section/product/model/item/valueThreshold)
-    query ``crm_sales``. Geography/RFM filters query ``crm_analysis``. If both
-    groups of filters are supplied, the two tables are joined on mobile number.
+    Rows come from ``crm_analysis`` (Geography/RFM filters); filters tied to the
+    product hierarchy (brand/section/product/model/item/valueThreshold) become
+    an EXISTS check against the ``crm_customer_product`` facts.  The caller
+    starts it with the download budget and iterates ``chunks()``.
     """
+    stmt, params = compile_audience(from_download_filters(filters), "rows")
+    return RowStream(stmt, params)
 
-    params = {}
-    sales_clauses = []
-    analysis_clauses = []
-
-    # --- Sales filters ---
-    if getattr(filters, "purchaseBrand", None):
-        sales_clauses.append("s.BRAND IN :brands")
-        params["brands"] = tuple(filters.purchaseBrand)
-    if getattr(filters, "section", None):
-        sales_clauses.append("s.SECTION IN :sections")
-        params["sections"] = tuple(filters.section)
-    if getattr(filters, "product", None):
-        sales_clauses.append("s.PRODUCT IN :products")
-        params["products"] = tuple(filters.product)
-    if getattr(filters, "model", None):
-        sales_clauses.append("s.MODEL IN :models")
-        params["models"] = tuple(filters.model)
-    if getattr(filters, "item", None):
-        sales_clauses.append("s.ITEM IN :items")
-        params["items"] = tuple(filters.item)
-    if getattr(filters, "valueThreshold", None) is not None:
-        sales_clauses.append("s.VALUE >= :val_threshold")
-        params["val_threshold"] = filters.valueThreshold
-
-    # --- Analysis filters ---
-    if getattr(filters, "branch", None):
-        analysis_clauses.append("a.LAST_IN_STORE_NAME IN :branch")
-        params["branch"] = tuple(filters.branch)
-    if getattr(filters, "city", None):
-        analysis_clauses.append("a.LAST_IN_STORE_CITY IN :city")
-        params["city"] = tuple(filters.city)
-    if getattr(filters, "state", None):
-        analysis_clauses.append("a.LAST_IN_STORE_STATE IN :state")
-        params["state"] = tuple(filters.state)
-    if getattr(filters, "rfmSegment", None):
-        analysis_clauses.append("a.SEGMENT_MAP IN :segment")
-        params["segment"] = tuple(filters.rfmSegment)
-    if getattr(filters, "rScore", None):
-        analysis_clauses.append("a.R_SCORE IN :rscore")
-        params["rscore"] = tuple(filters.rScore)
-
-    op_map = {"=": "=", ">=": ">=", "<=": "<="}
-    if getattr(filters, "recencyOp", None) and getattr(filters, "recencyMin", None) is not None:
-        if filters.recencyOp == "between" and getattr(filters, "recencyMax", None) is not None:
-            analysis_clauses.append("a.DAYS BETWEEN :rmin AND :rmax")
-            params["rmin"] = filters.recencyMin
-            params["rmax"] = filters.recencyMax
-        else:
-            op = op_map.get(filters.recencyOp)
-            if op:
-                analysis_clauses.append(f"a.DAYS {op} :rmin")
-                params["rmin"] = filters.recencyMin
-
-    if getattr(filters, "frequencyOp", None) and getattr(filters, "frequencyMin", None) is not None:
-        if filters.frequencyOp == "between" and getattr(filters, "frequencyMax", None) is not None:
-            analysis_clauses.append("a.F_VALUE BETWEEN :fmin AND :fmax")
-            params["fmin"] = filters.frequencyMin
-            params["fmax"] = filters.frequencyMax
-        else:
-            op = op_map.get(filters.frequencyOp)
-            if op:
-                analysis_clauses.append(f"a.F_VALUE {op} :fmin")
-                params["fmin"] = filters.frequencyMin
-
-    if getattr(filters, "monetaryOp", None) and getattr(filters, "monetaryMin", None) is not None:
-        if filters.monetaryOp == "between" and getattr(filters, "monetaryMax", None) is not None:
-            analysis_clauses.append("a.M_VALUE BETWEEN :mmin AND :mmax")
-            params["mmin"] = filters.monetaryMin
-            params["mmax"] = filters.monetaryMax
-        else:
-            op = op_map.get(filters.monetaryOp)
-            if op:
-                analysis_clauses.append(f"a.M_VALUE {op} :mmin")
-                params["mmin"] = filters.monetaryMin
-
-    # --- Build SQL ---
-    if sales_clauses and analysis_clauses:
-        sql = (
-            "SELECT DISTINCT s.CUST_MOBILENO,a.customer_name,a.segment_map FROM crm_sales s "
-            "JOIN crm_analysis a ON s.CUST_MOBILENO = a.CUST_MOBILENO"
-        )
-        where = sales_clauses + analysis_clauses
-    elif sales_clauses:
-        sql = "SELECT DISTINCT s.CUST_MOBILENO FROM crm_sales s"
-        where = sales_clauses
-    else:
-        sql = "SELECT DISTINCT a.CUST_MOBILENO,a.customer_name,a.segment_map FROM crm_analysis a"
-        where = analysis_clauses
 
-    if where:
-        sql += " WHERE " + " AND ".join(where)
+def estimate_mobile_numbers(db: Session, filters) -> dict:
+    """Sampled size of a download that ran out of time (see estimate_audience)."""
+    return estimate_audience(db, from_download_filters(filters))
 
-    
-    rows = db.execute(text(sql), params)
-    #.all()
-    
-    # rows = db.execute(text("""
-    #     SELECT CUST_MOBILENO,CUSTOMER_NAME,SEGMENT_MAP FROM crm_analysis_tcm
-    #     WHERE LAST_IN_STORE_CITY = :city 
-    # """), {"city": "COIMBATORE"})
-
-    #return [r[0] for r in rows if r[0]]
-    return rows
-
-
-def get_mobile_numbers1(db: Session, filters) -> list[str]:
-    query = text("SELECT * FROM your_table WHERE some_filter = :val")
-    rows = db.execute(query, {"val": "SOME_VALUE"})
-
-    def iter_csv():
-        output = StringIO()
-        writer = csv.writer(output)
-        # Write header
-        writer.writerow(rows.keys())
-        yield output.getvalue()
-        output.seek(0)
-        output.truncate(0)
-
-        # Write rows
-        for row in rows:
-            writer.writerow(row)
-            yield output.getvalue()
-            output.seek(0)
-            output.truncate(0)
-
-    headers = {"Content-Disposition": "attachment; filename=export.csv"}
-    return StreamingResponse(iter_csv(), headers=headers, media_type="text/csv")
-
-def expand_sql_with_params(sql, params, db):
-    """Expand a SQLAlchemy text() query with parameter values for debugging only."""
-    compiled = sql.compile(db.bind, compile_kwargs={"literal_binds": True})
-    final_sql = str(compiled)
-
-    for k, v in params.items():
-        placeholder = f":{k}"
-
-        if isinstance(v, tuple):
-            # Convert tuple into SQL IN list: ('A','B','C')
-            val = "(" + ",".join(f"'{x}'" if isinstance(x, str) else str(x) for x in v) + ")"
-        elif isinstance(v, str):
-            val = f"'{v}'"
-        elif v is None:
-            val = "NULL"
-        else:
-            val = str(v)
-
-        final_sql = final_sql.replace(placeholder, val)
-
-    return final_sql
 
 def get_campaign_run_details(db: Session, campaign_id: int) -> CampaignRunDetails | None:
     """Return run-time details for a campaign, joined with crm_sales and crm_analysis."""
@@ -550,116 +397,13 @@ def get_campaign_run_details(db: Session, campaign_id: int) -> CampaignRunDetail
     elif isinstance(camp.purchase_brand, str):
         brand_label = camp.purchase_brand
 
-    # --- Build SQL dynamically ---
-    clauses = ["c.id = :cid"]
-    params = {"cid": campaign_id}
-
-    # Geography filters
-    if camp.branch:
-        clauses.append("a.LAST_IN_STORE_CODE IN :branch")
-        params["branch"] = tuple(camp.branch)
-    if camp.city:
-        clauses.append("a.LAST_IN_STORE_CITY IN :city")
-        params["city"] = tuple(camp.city)
-    if camp.state:
-        clauses.append("a.LAST_IN_STORE_STATE IN :state")
-        params["state"] = tuple(camp.state)
-
-    # Recency
-    if camp.recency_op and camp.recency_min is not None:
-        if camp.recency_op == ">=":
-            clauses.append("a.DAYS >= :rmin")
-        elif camp.recency_op == "<=":
-            clauses.append("a.DAYS <= :rmin")
-        elif camp.recency_op == "=":
-            clauses.append("a.DAYS = :rmin")
-        params["rmin"] = camp.recency_min
-
-    # Frequency
-    if camp.frequency_op and camp.frequency_min is not None:
-        if camp.frequency_op == ">=":
-            clauses.append("a.F_VALUE >= :fmin")
-        elif camp.frequency_op == "<=":
-            clauses.append("a.F_VALUE <= :fmin")
-        elif camp.frequency_op == "=":
-            clauses.append("a.F_VALUE = :fmin")
-        params["fmin"] = camp.frequency_min
-
-    # Monetary
-    if camp.monetary_op and camp.monetary_min is not None:
-        if camp.monetary_op == ">=":
-            clauses.append("a.M_VALUE >= :mmin")
-        elif camp.monetary_op == "<=":
-            clauses.append("a.M_VALUE <= :mmin")
-        elif camp.monetary_op == "=":
-            clauses.append("a.M_VALUE = :mmin")
-        params["mmin"] = camp.monetary_min
-
-    # RFM Scores
-    if camp.r_score:
-        clauses.append("a.R_SCORE IN :r_score")
-        params["r_score"] = tuple(camp.r_score)
-    if camp.f_score:
-        clauses.append("a.F_SCORE IN :f_score")
-        params["f_score"] = tuple(camp.f_score)
-    if camp.m_score:
-        clauses.append("a.M_SCORE IN :m_score")
-        params["m_score"] = tuple(camp.m_score)
-
-    # Product hierarchy
-    if brand_label:
-        clauses.append("s.BRAND = :brand")
-        params["brand"] = brand_label
-    if camp.section:
-        clauses.append("s.SECTION IN :section")
-        params["section"] = tuple(camp.section)
-    if camp.product:
-        clauses.append("s.PRODUCT IN :product")
-        params["product"] = tuple(camp.product)
-    if camp.model:
-        clauses.append("s.MODELNO IN :model")
-        params["model"] = tuple(camp.model)
-    if camp.item:
-        clauses.append("s.ITEM_CODE IN :item")
-        params["item"] = tuple(camp.item)
-
-    # Value threshold
-    if camp.value_threshold is not None:
-        clauses.append("s.TOTAL_SALES >= :val_threshold")
-        params["val_threshold"] = camp.value_threshold
-
-    # Birthday / Anniversary
-    if camp.birthday_start and camp.birthday_end:
-        clauses.append("a.DOB BETWEEN :bday_start AND :bday_end")
-        params["bday_start"] = camp.birthday_start
-        params["bday_end"] = camp.birthday_end
-
-    if camp.anniversary_start and camp.anniversary_end:
-        clauses.append("a.ANNIV_DT BETWEEN :anniv_start AND :anniv_end")
-        params["anniv_start"] = camp.anniversary_start
-        params["anniv_end"] = camp.anniversary_end
-
-    # --- Final SQL ---
-    base_sql = f"""
-        SELECT COUNT(DISTINCT a.CUST_MOBILENO) AS cnt
-        FROM campaigns c
-        JOIN crm_sales s 
-          ON s.INVOICE_DATE BETWEEN c.start_date AND c.end_date
-        JOIN crm_analysis a
-          ON a.CUST_MOBILENO = s.CUST_MOBILENO
-        WHERE {" AND ".join(clauses)}
-    """
-
-    sql = text(base_sql)
-
-    # Debug print with expanded values
-    debug_sql = expand_sql_with_params(sql, params, db)
-    print("Final SQL with values →")
-    print(debug_sql)
-
-    # Execute query
-    row = db.execute(sql, params).first()
-    shortlisted_count = int(row.cnt) if row and row.cnt is not None else 0
+    # A frozen run audience is what the sends use, so report that; without a
+    # current freeze, what the next freeze will store
+    frozen = get_campaign_audience_info(db, campaign_id)
+    if frozen is not None and frozen["current"]:
+        shortlisted_count = frozen["customers"]
+    else:
+        shortlisted_count = count_eligible_customers(db, camp)
 
     # Return object
     return CampaignRunDetails(
@@ -700,123 +444,232 @@ def get_campaign_run_details(db: Session, campaign_id: int) -> CampaignRunDetail
         rfm_segment_label=rfm_segment_label or "-",
         brand_label=brand_label or "-",
         shortlisted_count=shortlisted_count,
+        audience_version=frozen["snapshot_version"] if frozen is not None else None,
     )
 
-def get_campaign_run_count_from_request(db: Session, filters: dict) -> int:
+# --- Total customers ---
+# The unfiltered audience only changes when data is reloaded, so it is
+# computed once per data version and shared by every count request.
+_total_cache = {"version": None, "total": None}
+_total_lock = threading.Lock()
+
+
+@on_data_reload
+def _clear_total_cache(version):
+    with _total_lock:
+        _total_cache["version"] = _total_cache["total"] = None
+
+
+def get_total_customers(db: Session) -> tuple[str | None, int]:
+    """(data version, customers in crm_analysis), cached until the next data load."""
+    version = get_data_version(db)
+    with _total_lock:
+        if _total_cache["total"] is not None and _total_cache["version"] == version:
+            return version, _total_cache["total"]
+
+    snapshot = get_snapshot(db, version)
+    if snapshot is not None:
+        total = snapshot.size
+    else:
+        # crm_analysis is built from crm_sales, so every customer has purchases
+        total_sql, _ = compile_audience({}, "count")
+        total = int(db.execute(total_sql).scalar() or 0)
+    with _total_lock:
+        _total_cache["version"], _total_cache["total"] = version, total
+    return version, total
+
+
+# --- Audience counts ---
+# Identical filter sets (however ordered) share one cached result per data
+# version, and concurrent identical requests wait on a single query.
+_count_cache = SingleFlightCache(max_entries=2048)
+# an HLL count is only shown when its standard error is at most this share of it
+HLL_MAX_RELATIVE_ERROR = float(os.getenv("AUDIENCE_HLL_MAX_RELATIVE_ERROR", "0.05"))
+
+
+def get_campaign_run_count_from_request(db: Session, filters: dict, approximate: bool = False) -> dict:
     """
-    Return count of distinct customers from crm_sales + crm_analysis
+    Return count of distinct customers from crm_customer_product + crm_analysis
     based only on request filter parameters (no campaigns table join).
+
+    With ``approximate`` the count comes from HyperLogLog sketches when the
+    exact bitmap count is not available, every filter is on a sketched
+    dimension and the estimate's relative error is within
+    HLL_MAX_RELATIVE_ERROR (intersections of small groups are not);
+    otherwise, and by default, it is exact.
     """
+    version, total = get_total_customers(db)
+    if approximate and customer_products_ready(version):
+        index = get_audience_index(db, version)
+        sketches = get_audience_sketches(db, version) if index is None else None
+        estimate = sketches.estimate(filters) if sketches is not None else None
+        if estimate is not None and (
+            estimate["standard_error"] <= HLL_MAX_RELATIVE_ERROR * max(estimate["shortlisted_customers"], 1)
+        ):
+            shortlisted, error = estimate["shortlisted_customers"], estimate["standard_error"]
+            return {
+                "total_customers": total,
+                "shortlisted_customers": shortlisted,
+                "estimated": True,
+                "method": "hll",
+                "low": max(0, math.floor(shortlisted - ESTIMATE_Z * error)),
+                "high": min(total, math.ceil(shortlisted + ESTIMATE_Z * error)),
+                "confidence": 0.95,
+                "data_version": version,
+            }
+
+    key = (version, canonical_key(filters))
+    try:
+        shortlisted = _count_cache.get_or_compute(
+            key, lambda: _count_audience(db, filters, version), version=version
+        )
+    except QueryCancelled:
+        raise
+    except QueryTimeout:
+        # over budget: answer from a sample instead of holding the request open
+        return {
+            "total_customers": total,
+            **estimate_audience(db, from_run_request(filters)),
+            "data_version": version,
+        }
+    return {
+        "total_customers": total,
+        "shortlisted_customers": shortlisted,
+        "data_version": version,
+    }
 
-    clauses = []
-    params = {}
-
-    # --- Geography filters ---
-    if filters.get("branch"):
-        clauses.append("a.LAST_IN_STORE_CODE IN :branch")
-        params["branch"] = tuple(filters["branch"])
-    if filters.get("city"):
-        clauses.append("a.LAST_IN_STORE_CITY IN :city")
-        params["city"] = tuple(filters["city"])
-    if filters.get("state"):
-        clauses.append("a.LAST_IN_STORE_STATE IN :state")
-        params["state"] = tuple(filters["state"])
-
-    # --- Recency ---
-    if filters.get("recency_op") and filters.get("recency_min") is not None:
-        op = filters["recency_op"]
-        if op in (">=", "<=", "="):
-            clauses.append(f"a.DAYS {op} :rmin")
-            params["rmin"] = filters["recency_min"]
-
-    # --- Frequency ---
-    if filters.get("frequency_op") and filters.get("frequency_min") is not None:
-        op = filters["frequency_op"]
-        if op in (">=", "<=", "="):
-            clauses.append(f"a.F_VALUE {op} :fmin")
-            params["fmin"] = filters["frequency_min"]
-
-    # --- Monetary ---
-    if filters.get("monetary_op") and filters.get("monetary_min") is not None:
-        op = filters["monetary_op"]
-        if op in (">=", "<=", "="):
-            clauses.append(f"a.M_VALUE {op} :mmin")
-            params["mmin"] = filters["monetary_min"]
-
-    # --- RFM Scores ---
-    if filters.get("r_score"):
-        clauses.append("a.R_SCORE IN :r_score")
-        params["r_score"] = tuple(filters["r_score"])
-    if filters.get("f_score"):
-        clauses.append("a.F_SCORE IN :f_score")
-        params["f_score"] = tuple(filters["f_score"])
-    if filters.get("m_score"):
-        clauses.append("a.M_SCORE IN :m_score")
-        params["m_score"] = tuple(filters["m_score"])
-
-    # --- Product hierarchy ---
-    if filters.get("brand"):
-        clauses.append("s.BRAND = :brand")
-        params["brand"] = filters["brand"]
-    if filters.get("section"):
-        clauses.append("s.SECTION IN :section")
-        params["section"] = tuple(filters["section"])
-    if filters.get("product"):
-        clauses.append("s.PRODUCT IN :product")
-        params["product"] = tuple(filters["product"])
-    if filters.get("model"):
-        clauses.append("s.MODELNO IN :model")
-        params["model"] = tuple(filters["model"])
-    if filters.get("item"):
-        clauses.append("s.ITEM_CODE IN :item")
-        params["item"] = tuple(filters["item"])
-
-    # --- Value Threshold ---
-    if filters.get("value_threshold") is not None:
-        clauses.append("s.TOTAL_SALES >= :val_threshold")
-        params["val_threshold"] = filters["value_threshold"]
-
-    # --- Birthday ---
-    if filters.get("birthday_start") and filters.get("birthday_end"):
-        clauses.append("a.DOB BETWEEN :bday_start AND :bday_end")
-        params["bday_start"] = filters["birthday_start"]
-        params["bday_end"] = filters["birthday_end"]
-
-    # --- Anniversary ---
-    if filters.get("anniversary_start") and filters.get("anniversary_end"):
-        clauses.append("a.ANNIV_DT BETWEEN :anniv_start AND :anniv_end")
-        params["anniv_start"] = filters["anniversary_start"]
-        params["anniv_end"] = filters["anniversary_end"]
-
-    # --- Final SQL ---
-    where_clause = " AND ".join(clauses) if clauses else "1=1"
 
-    
-    shortlisted_sql = text(f"""
-        SELECT COUNT(DISTINCT a.CUST_MOBILENO) AS cnt
-        FROM crm_sales s
-        JOIN crm_analysis a
-        ON a.CUST_MOBILENO = s.CUST_MOBILENO
-        WHERE {where_clause}
-    """)
+def _count_audience(db: Session, filters: dict, version: str | None) -> int:
+    """Shortlist size; the in-memory paths are only used for data ``version`` (the cache key's)."""
 
-    total_sql = text("""
-        SELECT COUNT(DISTINCT a.CUST_MOBILENO) AS cnt
-        FROM crm_sales s
-        JOIN crm_analysis a
-        ON a.CUST_MOBILENO = s.CUST_MOBILENO
-    """)
+    # Fastest path: roaring bitmaps per filter value (incl. purchase paths).
+    # crm_analysis is built from crm_sales, so every indexed customer has sales.
+    # The index reads crm_customer_product, so wait until it is current.
+    index = get_audience_index(db, version) if customer_products_ready(version) else None
+    shortlisted = index.count(filters) if index is not None else None
+    if shortlisted is not None:
+        return shortlisted
+
+    # Fast path: analysis-only filters evaluated on the in-memory snapshot.
+    snapshot = get_snapshot(db, version)
+    mask = snapshot.audience_mask(filters) if snapshot is not None else None
+    if mask is not None:
+        return int(mask.sum())
+
+    shortlisted_sql, params = compile_audience(from_run_request(filters), "count")
+    return int(execute_budgeted(db, shortlisted_sql, params, COUNT_BUDGET_MS).scalar() or 0)
 
-    # Debug print
-    debug_sql = expand_sql_with_params(shortlisted_sql, params, db)
-    print("Final SQL with values →")
-    print(debug_sql)
 
-    # Execute queries
-    shortlisted_row = db.execute(shortlisted_sql, params).first()
-    total_row = db.execute(total_sql).first()
+# --- Sampled estimates ---
+# When an exact audience query exceeds its budget, the same filters are
+# evaluated on a uniform random sample of customers (primary-key lookups, so
+# the cost is bounded by the sample size) and scaled to the whole base.
+ESTIMATE_SAMPLE_SIZE = int(os.getenv("AUDIENCE_ESTIMATE_SAMPLE_SIZE", "2000"))
+ESTIMATE_Z = 1.96  # 95% confidence
 
+
+def _wilson_interval(hits: int, n: int, population: int, z: float = ESTIMATE_Z) -> tuple[float, float]:
+    """Wilson score interval for a sampled proportion (stays sensible near 0 and 1),
+    narrowed by the finite-population correction for sampling without replacement."""
+    p = hits / n
+    if n >= population:
+        return p, p  # the sample was the whole base
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    half *= math.sqrt((population - n) / (population - 1))
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def estimate_audience(db: Session, canonical: dict) -> dict:
+    """Estimated shortlist size for canonical filters with a 95% interval.
+
+    Raises QueryTimeout if even the sample cannot be evaluated within
+    ESTIMATE_BUDGET_MS.
+    """
+    version, total = get_total_customers(db)
+    n = min(ESTIMATE_SAMPLE_SIZE, total)
+    if n == 0:
+        return {
+            "shortlisted_customers": 0,
+            "estimated": True,
+            "low": 0,
+            "high": 0,
+            "method": "sample",
+            "sample_size": 0,
+            "confidence": 0.95,
+        }
+
+    snapshot = get_snapshot(db, version)
+    if snapshot is not None:
+        sample = [snapshot.mobile[row] for row in random.sample(range(snapshot.size), n)]
+    else:
+        sample_sql = select(CRMAnalysisModel.CUST_MOBILENO).order_by(func.rand()).limit(n)
+        sample = [m for (m,) in execute_budgeted(db, sample_sql, None, ESTIMATE_BUDGET_MS)]
+        n = len(sample)
+
+    stmt, params = compile_audience({**canonical, "mobile": sample}, "count")
+    hits = int(execute_budgeted(db, stmt, params, ESTIMATE_BUDGET_MS).scalar() or 0)
+    low, high = _wilson_interval(hits, n, total)
+    return {
+        "shortlisted_customers": round(total * hits / n),
+        "estimated": True,
+        "low": math.floor(total * low),
+        "high": math.ceil(total * high),
+        "method": "sample",
+        "sample_size": n,
+        "confidence": 0.95,
+    }
+
+
+# --- Audience breakdowns ---
+_facets_cache = SingleFlightCache(max_entries=512)
+
+
+def get_campaign_run_facets(db: Session, filters: dict) -> dict:
+    """Shortlisted customers for count filters, broken down by segment, store,
+    city, state and R/F/M score in one pass."""
+    version, total = get_total_customers(db)
+    key = (version, canonical_key(filters))
+    shortlisted, facets = _facets_cache.get_or_compute(
+        key, lambda: _facet_audience(db, filters, version), version=version
+    )
     return {
-        "total_customers": int(total_row.cnt) if total_row and total_row.cnt is not None else 0,
-        "shortlisted_customers": int(shortlisted_row.cnt) if shortlisted_row and shortlisted_row.cnt is not None else 0,
+        "total_customers": total,
+        "shortlisted_customers": shortlisted,
+        "facets": facets,
+        "data_version": version,
     }
+
+
+def _facet_lists(counts: dict) -> dict:
+    return {
+        facet: [{"value": value, "customers": int(n)} for value, n in sorted(values.items())]
+        for facet, values in counts.items()
+    }
+
+
+def _facet_audience(db: Session, filters: dict, version: str | None) -> tuple[int, dict]:
+    # Same path order as _count_audience: bitmaps, then snapshot, then SQL.
+    index = get_audience_index(db, version) if customer_products_ready(version) else None
+    ids = index.ids(filters) if index is not None else None
+    if ids is not None:
+        return len(ids), _facet_lists(index.snapshot.facet_counts(ids))
+
+    snapshot = get_snapshot(db, version)
+    mask = snapshot.audience_mask(filters) if snapshot is not None else None
+    if mask is not None:
+        return int(mask.sum()), _facet_lists(snapshot.facet_counts(mask))
+
+    # One grouped scan over every dimension combination, folded per dimension.
+    stmt, params = compile_audience(from_run_request(filters), "facets")
+    counts = {key: {} for key in FACET_COLUMNS}
+    shortlisted = 0
+    for row in db.execute(stmt, params).mappings():
+        n = row["customers"]
+        shortlisted += n
+        for key in FACET_COLUMNS:
+            value = row[key]
+            if value is not None:
+                counts[key][value] = counts[key].get(value, 0) + n
+    return shortlisted, _facet_lists(counts)
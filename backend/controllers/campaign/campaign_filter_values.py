@@ -0,0 +1,79 @@
+"""Normalised campaign filter values (``campaign_filter_values``).
+
+Campaign list filters are stored as JSON arrays on ``campaigns``, which can
+only be searched with JSON_CONTAINS and a full scan.  Every selected value is
+also written as a ``(campaign_id, dimension, value)`` row, indexed on
+``(dimension, value)``, so "which campaigns target branch X" is an index
+lookup.  create/update keep the rows in step with the JSON columns; the
+JSON columns stay the source of truth for the campaign form.
+"""
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.campaign.campaign_filter_value_model import CampaignFilterValue
+from models.campaign.campaign_model import Campaign
+
+# Campaign JSON list columns mirrored into campaign_filter_values
+FILTER_DIMENSIONS = (
+    "rfm_segments",
+    "r_score",
+    "f_score",
+    "m_score",
+    "branch",
+    "city",
+    "state",
+    "purchase_brand",
+    "section",
+    "product",
+    "model",
+    "item",
+)
+
+
+def _values(selected) -> list[str]:
+    if selected is None:
+        return []
+    if not isinstance(selected, list):
+        selected = [selected]
+    return sorted({str(v) for v in selected if v is not None and v != ""})
+
+
+def sync_campaign_filter_values(db: Session, camp: Campaign):
+    """Rewrite the campaign's filter value rows from its JSON columns. Caller commits."""
+    db.execute(delete(CampaignFilterValue).where(CampaignFilterValue.campaign_id == camp.id))
+    rows = [
+        {"campaign_id": camp.id, "dimension": dimension, "value": value}
+        for dimension in FILTER_DIMENSIONS
+        for value in _values(getattr(camp, dimension))
+    ]
+    if rows:
+        db.execute(insert(CampaignFilterValue), rows)
+
+
+def get_campaigns_targeting(db: Session, dimension: str, value: str) -> list[Campaign]:
+    """Campaigns whose ``dimension`` filter selects ``value``, newest first."""
+    if dimension not in FILTER_DIMENSIONS:
+        raise ValueError(f"Unknown campaign filter: {dimension}")
+    return (
+        db.query(Campaign)
+        .join(CampaignFilterValue, CampaignFilterValue.campaign_id == Campaign.id)
+        .filter(CampaignFilterValue.dimension == dimension, CampaignFilterValue.value == str(value))
+        .order_by(Campaign.start_date.desc(), Campaign.id.desc())
+        .all()
+    )
+
+
+def backfill_campaign_filter_values():
+    """Fill campaign_filter_values for campaigns saved before it existed (runs at startup)."""
+    db = SessionLocal()
+    try:
+        if db.execute(select(func.count()).select_from(CampaignFilterValue)).scalar():
+            return
+        campaigns = db.query(Campaign).all()
+        for camp in campaigns:
+            sync_campaign_filter_values(db, camp)
+        db.commit()
+        print(f"Campaign filter values backfilled for {len(campaigns)} campaigns")
+    finally:
+        db.close()
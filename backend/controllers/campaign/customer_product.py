@@ -0,0 +1,119 @@
+"""Customer × product fact table (``crm_customer_product``).
+
+Audience queries only need to know whether a customer ever bought under a
+brand/section/product/model/item and how large that purchase was, so they
+read this table instead of the raw ``crm_sales`` lines.  It is refreshed
+incrementally on every data load: customers with sales on or after the stored
+INVOICE_DATE watermark have their rows re-aggregated from crm_sales (the
+watermark day itself is re-read, so rows loaded late for that day count).
+Refreshes run in the background; until one finishes for the current data
+version, audience SQL reads crm_sales instead (see audience_compiler).
+"""
+from datetime import datetime
+
+from sqlalchemy import Date, column, func, select, table, text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.customer_product import CRMCustomerProduct, CRMCustomerProductState
+from utils.background_refresh import BackgroundRefresh
+from utils.data_version import on_data_reload
+
+_STATE_ID = 1
+
+# data version the fact table is known to be current for (per process)
+_ready = {"version": None}
+
+_AGGREGATE_SQL = """
+    INSERT INTO crm_customer_product (
+        CUST_MOBILENO, BRAND, SECTION, PRODUCT, MODELNO, ITEM_CODE, ITEM_DESCRIPTION,
+        TOTAL_SALES, MAX_LINE_SALES, LINE_COUNT, FIRST_PURCHASE_DATE, LAST_PURCHASE_DATE
+    )
+    SELECT
+        s.CUST_MOBILENO, s.BRAND, s.SECTION, s.PRODUCT, s.MODELNO, s.ITEM_CODE, s.ITEM_DESCRIPTION,
+        SUM(s.TOTAL_SALES), MAX(s.TOTAL_SALES), COUNT(*), MIN(s.INVOICE_DATE), MAX(s.INVOICE_DATE)
+    FROM crm_sales s
+    WHERE s.CUST_MOBILENO IS NOT NULL {where}
+    GROUP BY s.CUST_MOBILENO, s.BRAND, s.SECTION, s.PRODUCT, s.MODELNO, s.ITEM_CODE, s.ITEM_DESCRIPTION
+"""
+
+# crm_sales has no ORM model; only the watermark column needs a type
+_crm_sales = table("crm_sales", column("INVOICE_DATE", Date))
+
+_TOUCHED_CUSTOMERS = "SELECT DISTINCT CUST_MOBILENO FROM crm_sales WHERE INVOICE_DATE >= :since"
+
+
+def refresh_customer_products(db: Session, full: bool = False, loaded_at: datetime | None = None) -> bool:
+    """Fold crm_sales lines on/after the watermark into crm_customer_product.
+
+    Returns True when the table was rewritten.  The state row is locked for
+    the duration so concurrent workers refresh one at a time.  ``loaded_at``
+    is the data load being caught up with: when the watermark has not moved
+    and the table was already refreshed after that load (by another worker),
+    nothing is done.
+    """
+    state = (
+        db.query(CRMCustomerProductState)
+        .filter(CRMCustomerProductState.id == _STATE_ID)
+        .with_for_update()
+        .first()
+    )
+    if state is None:
+        state = CRMCustomerProductState(id=_STATE_ID)
+        db.add(state)
+        full = True
+    elif state.INVOICE_DATE is None:
+        full = True
+
+    latest = db.execute(select(func.max(_crm_sales.c.INVOICE_DATE))).scalar()
+    if not full and latest is None:
+        db.rollback()
+        return False
+    if (
+        not full
+        and latest <= state.INVOICE_DATE
+        and loaded_at is not None
+        and state.REFRESHED_AT is not None
+        and state.REFRESHED_AT >= loaded_at
+    ):
+        db.rollback()
+        return False
+
+    if full:
+        db.execute(CRMCustomerProduct.__table__.delete())
+        db.execute(text(_AGGREGATE_SQL.format(where="")))
+    else:
+        # a customer's rows are rebuilt from all of their sales, so re-reading
+        # the watermark day never double counts
+        params = {"since": state.INVOICE_DATE}
+        db.execute(text(f"DELETE FROM crm_customer_product WHERE CUST_MOBILENO IN ({_TOUCHED_CUSTOMERS})"), params)
+        db.execute(text(_AGGREGATE_SQL.format(where=f"AND s.CUST_MOBILENO IN ({_TOUCHED_CUSTOMERS})")), params)
+
+    state.INVOICE_DATE = latest
+    state.REFRESHED_AT = datetime.now()
+    db.commit()
+    print(f"Customer product facts refreshed ({'full' if full else 'incremental'}) up to {latest}")
+    return True
+
+
+def _refresh(version):
+    db = SessionLocal()
+    try:
+        loaded_at = datetime.fromisoformat(version) if version else None
+        refresh_customer_products(db, loaded_at=loaded_at)
+        _ready["version"] = version
+    finally:
+        db.close()
+
+
+_refresher = BackgroundRefresh("customer-product-refresh", _refresh)
+
+
+@on_data_reload
+def _refresh_on_reload(version):
+    _refresher.request(version)
+
+
+def customer_products_ready(version) -> bool:
+    """True once the fact table has been refreshed for data ``version``."""
+    return version is not None and _ready["version"] == version
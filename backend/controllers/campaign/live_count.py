@@ -0,0 +1,141 @@
+"""Live audience counts for the Create Campaign form over a WebSocket.
+
+The form keeps one socket open and sends filter deltas as the user edits::
+
+    {"seq": 7, "set": {"branch": ["S01"], "r_score": [4, 5]}, "unset": ["brand"]}
+
+(``{"seq": .., "filters": {...}}`` replaces the whole filter set).  The server
+keeps the current filters, waits LIVE_DEBOUNCE_SECONDS after the last delta,
+then counts with :func:`get_campaign_run_count_from_request` on its own
+session.  A delta that arrives while a count is running supersedes it: the
+result is dropped and, on MySQL, the running statement is killed.  Every
+reply echoes the ``seq`` of the last delta it reflects, so the client can
+ignore anything older than what it has shown.  A message that fails
+validation is answered with ``{"seq", "error", "rejected": true}`` and leaves
+the server's filters unchanged; the client then sends its whole filter set
+with its next message.
+"""
+import asyncio
+import os
+import threading
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from controllers.campaign.campaign_controller import get_campaign_run_count_from_request
+from database import SessionLocal
+from schemas.campaign.campaign_schema import CampaignRunFilters
+from utils.query_budget import QueryCancelled, QueryTimeout, connection_id, kill_query
+
+LIVE_DEBOUNCE_SECONDS = float(os.getenv("LIVE_COUNT_DEBOUNCE_SECONDS", "0.3"))
+
+
+def apply_delta(filters: dict, message: dict) -> dict:
+    """Current filters after one client message."""
+    if "filters" in message:
+        merged = dict(message["filters"] or {})
+    else:
+        merged = {**filters, **(message.get("set") or {})}
+        for key in message.get("unset") or ():
+            merged.pop(key, None)
+    return {k: v for k, v in merged.items() if v is not None}
+
+
+class _CountJob:
+    """One count on its own session; cancel() drops the result and kills the query."""
+
+    def __init__(self, filters: dict, seq: int):
+        self.filters = filters
+        self.seq = seq
+        self.connection_id = None
+        self.cancelled = False
+        # guards connection_id: once the worker clears it, the connection may
+        # already belong to another request
+        self._lock = threading.Lock()
+        self.task = asyncio.ensure_future(run_in_threadpool(self._run))
+
+    def _run(self) -> dict:
+        db = SessionLocal()
+        try:
+            with self._lock:
+                self.connection_id = connection_id(db)
+            return get_campaign_run_count_from_request(db, self.filters)
+        finally:
+            with self._lock:
+                self.connection_id = None
+            db.close()
+
+    async def cancel(self):
+        self.cancelled = True
+        # nobody waits for a superseded job; swallow whatever it ends with
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        await run_in_threadpool(self._kill)
+
+    def _kill(self):
+        # held across the KILL so the worker cannot hand the connection back meanwhile
+        with self._lock:
+            if self.connection_id is not None:
+                kill_query(self.connection_id, "live count superseded")
+
+
+async def serve_live_count(websocket: WebSocket):
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    filters, seq = {}, 0
+    deadline = None  # when the debounced count should start
+    job = None
+    receive = asyncio.ensure_future(websocket.receive_json())
+    try:
+        while True:
+            waits = {receive} if job is None else {receive, job.task}
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait(waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if receive in done:
+                try:
+                    message = receive.result()
+                except ValueError:
+                    message = None  # not JSON
+                receive = asyncio.ensure_future(websocket.receive_json())
+                if not isinstance(message, dict):
+                    await websocket.send_json({"seq": seq, "error": "Expected a JSON object", "rejected": True})
+                    continue
+                seq = message.get("seq", seq + 1)
+                try:
+                    filters = CampaignRunFilters(**apply_delta(filters, message)).model_dump(exclude_none=True)
+                except ValidationError as e:
+                    await websocket.send_json({"seq": seq, "error": str(e), "rejected": True})
+                    continue
+                if job is not None:
+                    await job.cancel()
+                    job = None
+                deadline = loop.time() + LIVE_DEBOUNCE_SECONDS
+                continue
+
+            if job is not None and job.task in done:
+                finished, job = job, None
+                if finished.cancelled:
+                    continue
+                try:
+                    result = finished.task.result()
+                except QueryCancelled:
+                    continue
+                except QueryTimeout as e:
+                    await websocket.send_json({"seq": finished.seq, "error": f"Audience count timed out: {e}"})
+                    continue
+                except Exception as e:
+                    await websocket.send_json({"seq": finished.seq, "error": str(e)})
+                    continue
+                await websocket.send_json({"seq": finished.seq, **result})
+                continue
+
+            if deadline is not None and loop.time() >= deadline:
+                deadline = None
+                job = _CountJob(filters, seq)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receive.cancel()
+        if job is not None:
+            await job.cancel()
@@ -1,15 +1,57 @@
 from typing import List, Dict
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
 from datetime import date
 from fastapi import Query
+from fastapi.responses import StreamingResponse
 
 from database import get_db
 from models.crm_analysis import CRMAnalysis as CRMAnalysisModel
-from schemas.crm_analysis import CRMAnalysis as CRMAnalysisSchema
+from models.dashboard_summary import CRMDashboardSummary
+from schemas.crm_analysis import CRMAnalysis as CRMAnalysisSchema, CRMAnalysisPage
+from controllers.dashboard_filters import apply_dashboard_filters
+from controllers.dashboard_cohorts import (
+    DEFAULT_COHORT_YEARS,
+    MAX_COHORT_YEARS,
+    get_customer_cohorts,
+)
+from controllers.dashboard_export import EXPORT_FORMATS, arrow_schema, iter_arrow, iter_ndjson, pa
+from controllers.dashboard_summary import (
+    DAYS_BUCKET_OVERFLOW,
+    DAYS_BUCKETS,
+    days_bucket_expr,
+    summary_available,
+    summary_query,
+)
+from utils.crm_snapshot import get_snapshot
+from utils.db_stream import STREAM_CHUNK_SIZE, stream_chunks
+from utils.response_cache import cached_json_response
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
+# Columns callers may request through ``fields=`` on the paged endpoint.
+DASHBOARD_COLUMNS = {c.name: c for c in CRMAnalysisModel.__table__.columns}
+
+PAGE_SIZE_DEFAULT = 1000
+PAGE_SIZE_MAX = 10000
+
+
+def _projected_columns(fields: str | None):
+    """Resolve ``fields=`` into table columns; CUST_MOBILENO is always kept for the cursor."""
+    if not fields:
+        return list(DASHBOARD_COLUMNS.values())
+
+    names = [f.strip().upper() for f in fields.split(",") if f.strip()]
+    unknown = [n for n in names if n not in DASHBOARD_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    if "CUST_MOBILENO" not in names:
+        names.insert(0, "CUST_MOBILENO")
+    # keep caller order, drop duplicates
+    return [DASHBOARD_COLUMNS[n] for n in dict.fromkeys(names)]
+
 
 @router.get("/", response_model=List[CRMAnalysisSchema])
 # def get_dashboard_data(db: Session = Depends(get_db)):
@@ -17,6 +59,105 @@ router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 #     return db.query(CRMAnalysisModel).all()
 
 def get_dashboard_data(
+    request: Request,
+    start_date: date | None = Query(None, description="Start of transaction date range"),
+    end_date:   date | None = Query(None, description="End of transaction date range"),
+    phone: str | None = None,
+    name: str | None = None,
+    r_score: int | None = None,
+    f_score: int | None = None,
+    m_score: int | None = None,
+    limit: int = Query(PAGE_SIZE_MAX, ge=1, le=PAGE_SIZE_MAX),
+    db: Session = Depends(get_db),
+):
+    """Fetch dashboard records filtered by optional query parameters.
+
+    Legacy full-row endpoint: at most ``limit`` rows (by CUST_MOBILENO).  When
+    more rows match, the response carries ``X-Truncated: true`` and
+    ``X-Next-Cursor`` (the last row's CUST_MOBILENO) for continuing with
+    ``/dashboard/page?cursor=``.
+    """
+
+    def build():
+        query = apply_dashboard_filters(
+            db.query(CRMAnalysisModel),
+            start_date, end_date, phone, name, r_score, f_score, m_score,
+        )
+        # fetch one extra row to know whether the result was cut off
+        rows = query.order_by(CRMAnalysisModel.CUST_MOBILENO).limit(limit + 1).all()
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers = {"X-Truncated": "true", "X-Next-Cursor": rows[-1].CUST_MOBILENO}
+        return [CRMAnalysisSchema.model_validate(r, from_attributes=True) for r in rows], headers
+
+    return cached_json_response(request, db, build, with_headers=True)
+
+
+# --- Metric cards and R/F/M charts ---
+# (upper bound, label) per bar; values above the last bound go to the overflow label
+R_VALUE_BUCKETS = [(200, "1-200"), (400, "200-400"), (600, "400-600"), (800, "600-800"), (1000, "800-1000")]
+M_VALUE_BUCKETS = [(1000, "1-1000"), (2000, "1000-2000"), (3000, "2000-3000"), (4000, "3000-4000"), (5000, "4000-5000")]
+
+
+def _value_bucket(column, buckets, overflow: str):
+    value = func.coalesce(column, 0)
+    return case(*[(value <= upper, label) for upper, label in buckets], else_=overflow)
+
+
+@router.get("/metrics")
+def get_dashboard_metrics(
+    request: Request,
+    start_date: date | None = Query(None, description="Start of transaction date range"),
+    end_date:   date | None = Query(None, description="End of transaction date range"),
+    phone: str | None = None,
+    name: str | None = None,
+    r_score: int | None = None,
+    f_score: int | None = None,
+    m_score: int | None = None,
+    db: Session = Depends(get_db),
+):
+    """Totals and per-value customer counts behind the metric cards and R/F/M charts.
+
+    Aggregated in SQL, so the dashboard no longer pulls every matching row.
+    """
+
+    def build():
+        filters = (start_date, end_date, phone, name, r_score, f_score, m_score)
+        totals = apply_dashboard_filters(
+            db.query(
+                func.count(CRMAnalysisModel.CUST_MOBILENO).label("customers"),
+                func.sum(CRMAnalysisModel.NO_OF_ITEMS).label("items"),
+                func.sum(CRMAnalysisModel.F_VALUE).label("transactions"),
+                func.sum(CRMAnalysisModel.M_VALUE).label("spending"),
+                func.sum(CRMAnalysisModel.DAYS).label("days"),
+                func.sum(case((CRMAnalysisModel.F_VALUE > 1, 1), else_=0)).label("returning_customers"),
+            ),
+            *filters,
+        ).one()
+
+        def counts(expr) -> Dict[str, int]:
+            rows = apply_dashboard_filters(
+                db.query(expr.label("value"), func.count().label("customers")), *filters
+            ).group_by(expr).all()
+            return {str(row.value): int(row.customers) for row in rows if row.value is not None}
+
+        return {
+            **{key: int(value or 0) for key, value in totals._asdict().items()},
+            "r_scores": counts(CRMAnalysisModel.R_SCORE),
+            "f_scores": counts(CRMAnalysisModel.F_SCORE),
+            "m_scores": counts(CRMAnalysisModel.M_SCORE),
+            "visits": counts(func.coalesce(CRMAnalysisModel.F_VALUE, 0)),
+            "r_value_buckets": counts(_value_bucket(CRMAnalysisModel.R_VALUE, R_VALUE_BUCKETS, ">1000")),
+            "m_value_buckets": counts(_value_bucket(CRMAnalysisModel.M_VALUE, M_VALUE_BUCKETS, ">5000")),
+        }
+
+    return cached_json_response(request, db, build)
+
+
+@router.get("/page", response_model=CRMAnalysisPage)
+def get_dashboard_page(
+    request: Request,
     start_date: date | None = Query(None, description="Start of transaction date range"),
     end_date:   date | None = Query(None, description="End of transaction date range"),
     phone: str | None = None,
@@ -24,44 +165,97 @@ def get_dashboard_data(
     r_score: int | None = None,
     f_score: int | None = None,
     m_score: int | None = None,
+    fields: str | None = Query(None, description="Comma separated crm_analysis columns to return"),
+    cursor: str | None = Query(None, description="CUST_MOBILENO of the last row of the previous page"),
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    include_total: bool = Query(True, description="Count all matching rows (skip on follow-up pages)"),
     db: Session = Depends(get_db),
 ):
-    """Fetch dashboard records filtered by optional query parameters."""
-
-    query = db.query(CRMAnalysisModel)
-     # date filters (use whichever date field makes sense – e.g. FIRST_IN_DATE)
-    if start_date:
-        query = query.filter(CRMAnalysisModel.FIRST_IN_DATE >= start_date)
-    if end_date:
-        query = query.filter(CRMAnalysisModel.FIRST_IN_DATE <= end_date)
-    if phone:
-        query = query.filter(CRMAnalysisModel.CUST_MOBILENO == phone)
-    if name:
-        query = query.filter(CRMAnalysisModel.CUSTOMER_NAME == name)
-    if r_score is not None:
-        query = query.filter(CRMAnalysisModel.R_SCORE == r_score)
-    if f_score is not None:
-        query = query.filter(CRMAnalysisModel.F_SCORE == f_score)
-    if m_score is not None:
-        query = query.filter(CRMAnalysisModel.M_SCORE == m_score)
-    
-    # sql = query.statement.compile(
-    #     compile_kwargs={"literal_binds": True}
-    # )
-    # print(str(sql))   # ← this will print something like below
-
-    # return query.all()
-
-    
-
-    sql = query.statement.compile(compile_kwargs={"literal_binds": True})
-    print(str(sql))
-
-    return query.all()
+    """Keyset-paginated dashboard rows ordered by CUST_MOBILENO.
+
+    Only the requested ``fields`` are selected, rows come back as plain dicts
+    (no ORM objects / Pydantic row models) and at most ``limit`` rows are held
+    in memory, so the cost per request does not grow with the table.
+    """
+
+    def build():
+        columns = _projected_columns(fields)
+        filters = (start_date, end_date, phone, name, r_score, f_score, m_score)
+
+        query = apply_dashboard_filters(db.query(*columns), *filters)
+        if cursor:
+            query = query.filter(CRMAnalysisModel.CUST_MOBILENO > cursor)
+
+        # fetch one extra row to know whether another page exists
+        rows = query.order_by(CRMAnalysisModel.CUST_MOBILENO).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        total = None
+        snapshot = get_snapshot(db) if include_total else None
+        if snapshot is not None:
+            total = int(snapshot.dashboard_mask(*filters).sum())
+        elif include_total and summary_available(db, start_date, end_date, phone, name):
+            total = int(summary_query(
+                db,
+                func.coalesce(func.sum(CRMDashboardSummary.CUSTOMER_COUNT), 0),
+                start_date=start_date, end_date=end_date,
+                r_score=r_score, f_score=f_score, m_score=m_score,
+            ).scalar())
+        elif include_total:
+            total = apply_dashboard_filters(
+                db.query(func.count(CRMAnalysisModel.CUST_MOBILENO)), *filters
+            ).scalar()
+
+        return {
+            "items": [row._asdict() for row in rows],
+            "next_cursor": rows[-1].CUST_MOBILENO if has_more else None,
+            "total": total,
+        }
+
+    return cached_json_response(request, db, build)
+
+
+@router.get("/export")
+def export_dashboard_data(
+    start_date: date | None = Query(None, description="Start of transaction date range"),
+    end_date:   date | None = Query(None, description="End of transaction date range"),
+    phone: str | None = None,
+    name: str | None = None,
+    r_score: int | None = None,
+    f_score: int | None = None,
+    m_score: int | None = None,
+    format: str = Query("ndjson", description="ndjson or arrow"),
+    fields: str | None = Query(None, description="Comma separated crm_analysis columns to return"),
+    chunk_size: int = Query(STREAM_CHUNK_SIZE, ge=100, le=PAGE_SIZE_MAX * 5),
+    db: Session = Depends(get_db),
+):
+    """Stream every matching dashboard row as NDJSON or an Arrow IPC stream.
+
+    Rows come off a server-side cursor ``chunk_size`` at a time, so memory
+    stays flat however many customers match.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if format == "arrow" and pa is None:
+        raise HTTPException(status_code=400, detail="Arrow export needs pyarrow installed on the server")
+
+    columns = _projected_columns(fields)
+    statement = apply_dashboard_filters(
+        db.query(*columns),
+        start_date, end_date, phone, name, r_score, f_score, m_score,
+    ).order_by(CRMAnalysisModel.CUST_MOBILENO).statement
+
+    chunks = stream_chunks(statement, chunk_size=chunk_size)
+    body = iter_arrow(chunks, arrow_schema(columns)) if format == "arrow" else iter_ndjson(chunks)
+    extension = "arrows" if format == "arrow" else "ndjson"
+    headers = {"Content-Disposition": f"attachment; filename=dashboard.{extension}"}
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[format], headers=headers)
 
 
 @router.get("/last_three_charts")
 def get_last_three_charts(
+    request: Request,
     start_date: date | None = Query(None, description="Start of transaction date range"),
     end_date: date | None = Query(None, description="End of transaction date range"),
     phone: str | None = None,
@@ -69,88 +263,62 @@ def get_last_three_charts(
     r_score: int | None = None,
     f_score: int | None = None,
     m_score: int | None = None,
+    years: int = Query(DEFAULT_COHORT_YEARS, ge=1, le=MAX_COHORT_YEARS, description="Fiscal years in the customer % chart"),
     db: Session = Depends(get_db),
 ):
     """Return aggregated data used by the last three dashboard charts."""
 
-    query = db.query(CRMAnalysisModel)
-    if start_date:
-        query = query.filter(CRMAnalysisModel.FIRST_IN_DATE >= start_date)
-    if end_date:
-        query = query.filter(CRMAnalysisModel.FIRST_IN_DATE <= end_date)
-    if phone:
-        query = query.filter(CRMAnalysisModel.CUST_MOBILENO == phone)
-    if name:
-        query = query.filter(CRMAnalysisModel.CUSTOMER_NAME == name)
-    if r_score is not None:
-        query = query.filter(CRMAnalysisModel.R_SCORE == r_score)
-    if f_score is not None:
-        query = query.filter(CRMAnalysisModel.F_SCORE == f_score)
-    if m_score is not None:
-        query = query.filter(CRMAnalysisModel.M_SCORE == m_score)
-
-    rows = query.all()
-
-    # Total Customer by Segment
-    segment_counts: Dict[str, int] = {}
-    for r in rows:
-        seg = r.SEGMENT_MAP or "Unknown"
-        segment_counts[seg] = segment_counts.get(seg, 0) + 1
-    segment_data = [{"name": name, "value": count} for name, count in segment_counts.items()]
-
-    # Days to Return Bucket
-    buckets = {
-        "1 Month": 0,
-        "1-2 Month": 0,
-        "2-3 Month": 0,
-        "3-6 Month": 0,
-        "6 Month-1 Yr": 0,
-        "1-2 Yr": 0,
-        ">2 Yr": 0,
-    }
-    for r in rows:
-        days = r.DAYS or 0
-        if days <= 30:
-            buckets["1 Month"] += 1
-        elif days <= 60:
-            buckets["1-2 Month"] += 1
-        elif days <= 90:
-            buckets["2-3 Month"] += 1
-        elif days <= 180:
-            buckets["3-6 Month"] += 1
-        elif days <= 365:
-            buckets["6 Month-1 Yr"] += 1
-        elif days <= 730:
-            buckets["1-2 Yr"] += 1
-        else:
-            buckets[">2 Yr"] += 1
-    days_bucket_data = [{"bucket": b, "value": v} for b, v in buckets.items()]
-
-    # Current Vs New Customer % (FY)
-    year_totals = {
-        "2020": sum(r.FIFTH_YR_COUNT or 0 for r in rows),
-        "2021": sum(r.FOURTH_YR_COUNT or 0 for r in rows),
-        "2022": sum(r.THIRD_YR_COUNT or 0 for r in rows),
-        "2023": sum(r.SECOND_YR_COUNT or 0 for r in rows),
-        "2024": sum(r.FIRST_YR_COUNT or 0 for r in rows),
-    }
-    cumulative_old = 0
-    customer_percent_data = []
-    for year in ["2020", "2021", "2022", "2023", "2024"]:
-        new = year_totals[year]
-        total = new + cumulative_old
-        if total:
-            new_pct = round(new / total * 100, 2)
-            old_pct = round(cumulative_old / total * 100, 2)
+    def build():
+        filters = (start_date, end_date, phone, name, r_score, f_score, m_score)
+        segment_counts: Dict[str, int] = {}
+        buckets = {label: 0 for _, label in DAYS_BUCKETS}
+        buckets[DAYS_BUCKET_OVERFLOW] = 0
+
+        snapshot = get_snapshot(db)
+        mask = None
+        if snapshot is not None:
+            # in-memory column arrays, no DB round trip
+            mask = snapshot.dashboard_mask(*filters)
+            segment_counts = snapshot.segment_counts(mask)
+            bucket_values = snapshot.days_bucket_counts(mask, [upper for upper, _ in DAYS_BUCKETS])
+            buckets = dict(zip(buckets, bucket_values))
+            rows = []
+        elif summary_available(db, start_date, end_date, phone, name):
+            # pre-aggregated per (R, F, M, segment, month, bucket)
+            rows = summary_query(
+                db,
+                CRMDashboardSummary.SEGMENT_MAP,
+                CRMDashboardSummary.DAYS_BUCKET.label("bucket"),
+                func.sum(CRMDashboardSummary.CUSTOMER_COUNT).label("customers"),
+                start_date=start_date, end_date=end_date,
+                r_score=r_score, f_score=f_score, m_score=m_score,
+            ).group_by(CRMDashboardSummary.SEGMENT_MAP, CRMDashboardSummary.DAYS_BUCKET).all()
         else:
-            new_pct = old_pct = 0.0
-        customer_percent_data.append(
-            {"year": year, "newCustomer": new_pct, "oldCustomer": old_pct}
-        )
-        cumulative_old += new
+            bucket = days_bucket_expr().label("bucket")
+            rows = apply_dashboard_filters(
+                db.query(CRMAnalysisModel.SEGMENT_MAP, bucket, func.count().label("customers")),
+                *filters,
+            ).group_by(CRMAnalysisModel.SEGMENT_MAP, bucket).all()
+
+        # one row per (segment, bucket) – a few dozen rows at most
+        for row in rows:
+            seg = row.SEGMENT_MAP or "Unknown"
+            segment_counts[seg] = segment_counts.get(seg, 0) + int(row.customers)
+            buckets[row.bucket] += int(row.customers)
+
+        # Total Customer by Segment
+        segment_data = [{"name": name, "value": count} for name, count in segment_counts.items()]
+
+        # Days to Return Bucket
+        days_bucket_data = [{"bucket": b, "value": v} for b, v in buckets.items()]
+
+        # Current Vs New Customer % (FY)
+        customer_percent_data = get_customer_cohorts(db, filters, years, snapshot=snapshot, mask=mask)
+
+        return {
+            "segmentData": segment_data,
+            "daysBucketData": days_bucket_data,
+            "customerPercentData": customer_percent_data,
+        }
 
-    return {
-        "segmentData": segment_data,
-        "daysBucketData": days_bucket_data,
-        "customerPercentData": customer_percent_data,
-    }
\ No newline at end of file
+    return cached_json_response(request, db, build)
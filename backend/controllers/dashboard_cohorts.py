@@ -0,0 +1,109 @@
+"""Fiscal-year customer cohorts for the "Current Vs New Customer %" chart.
+
+Every customer is placed by the fiscal year of FIRST_IN_DATE (acquisition) and
+of LAST_IN_DATE (latest purchase).  For a fiscal year Y:
+
+* new customers     – first FY == Y
+* current customers – first FY <  Y <= last FY (acquired earlier, still buying)
+
+Both follow from one ``GROUP BY first_fy, last_fy`` over crm_analysis (or the
+in-memory snapshot), so any number of years costs the same single scan.  The
+result is cached per filter set until the next data load.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from controllers.dashboard_filters import apply_dashboard_filters
+from models.crm_analysis import CRMAnalysis as CRMAnalysisModel
+from utils.data_version import get_data_version, on_data_reload
+
+# Month the fiscal year starts in (April for Indian FY); FY is labelled by its start year.
+FY_START_MONTH = int(os.getenv("FISCAL_YEAR_START_MONTH", "4"))
+DEFAULT_COHORT_YEARS = 5
+MAX_COHORT_YEARS = 20
+CACHE_SIZE = 256
+
+_cache: OrderedDict = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+@on_data_reload
+def _clear_cache(version):
+    with _cache_lock:
+        _cache.clear()
+
+
+def fiscal_year_expr(column):
+    """SQL expression for the fiscal (start) year of a date column."""
+    return func.year(column) - case((func.month(column) < FY_START_MONTH, 1), else_=0)
+
+
+def _pairs_from_sql(db: Session, filters: tuple) -> dict:
+    first_fy = fiscal_year_expr(CRMAnalysisModel.FIRST_IN_DATE).label("first_fy")
+    last_fy = fiscal_year_expr(CRMAnalysisModel.LAST_IN_DATE).label("last_fy")
+    rows = (
+        apply_dashboard_filters(db.query(first_fy, last_fy, func.count().label("customers")), *filters)
+        .filter(CRMAnalysisModel.FIRST_IN_DATE.isnot(None))
+        .group_by(first_fy, last_fy)
+        .all()
+    )
+    return {(int(r.first_fy), int(r.last_fy) if r.last_fy is not None else None): int(r.customers) for r in rows}
+
+
+def cohort_percentages(pairs: dict, years: int) -> list:
+    """Fold {(first_fy, last_fy): customers} into the chart rows for the latest ``years`` FYs."""
+    if not pairs:
+        return []
+    latest = max(max(first, last if last is not None else first) for first, last in pairs)
+    data = []
+    for year in range(latest - years + 1, latest + 1):
+        new = sum(n for (first, _), n in pairs.items() if first == year)
+        current = sum(
+            n for (first, last), n in pairs.items()
+            if first < year and last is not None and last >= year
+        )
+        total = new + current
+        if total:
+            new_pct = round(new / total * 100, 2)
+            old_pct = round(current / total * 100, 2)
+        else:
+            new_pct = old_pct = 0.0
+        data.append({"year": str(year), "newCustomer": new_pct, "oldCustomer": old_pct})
+    return data
+
+
+def get_customer_cohorts(
+    db: Session,
+    filters: tuple,
+    years: int = DEFAULT_COHORT_YEARS,
+    snapshot=None,
+    mask=None,
+) -> list:
+    """Chart rows for the dashboard ``filters`` (apply_dashboard_filters order).
+
+    When a loaded crm_analysis snapshot and its filter ``mask`` are passed the
+    pairs are counted in memory, otherwise with one grouped SQL query.
+    """
+    # key by the version of the data counted: the snapshot's when one is passed
+    version = snapshot.version if snapshot is not None and mask is not None else get_data_version(db)
+    key = (filters, years, version)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    if snapshot is not None and mask is not None:
+        pairs = snapshot.fiscal_year_pairs(mask, FY_START_MONTH)
+    else:
+        pairs = _pairs_from_sql(db, filters)
+    data = cohort_percentages(pairs, years)
+
+    with _cache_lock:
+        _cache[key] = data
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return data
@@ -0,0 +1,81 @@
+"""NDJSON / Arrow IPC encoders for the streamed dashboard export.
+
+Both take the ``(column_names, rows)`` chunks produced by
+:func:`utils.db_stream.stream_chunks` and yield bytes per chunk, so the export
+never materialises the full result or builds ORM / Pydantic objects.
+"""
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import Date, DateTime, Integer, Numeric
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow export is optional
+    pa = None
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_ndjson(chunks):
+    """One JSON object per line, encoded a chunk at a time."""
+    dumps = json.JSONEncoder(separators=(",", ":"), default=_json_default).encode
+    for keys, rows in chunks:
+        yield "".join(dumps(dict(zip(keys, row))) + "\n" for row in rows).encode()
+
+
+def _arrow_type(column):
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column.type, Date):
+        return pa.date32()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Numeric):
+        return pa.float64()
+    return pa.string()
+
+
+def arrow_schema(columns):
+    """Arrow schema for table columns, fixed up front so every batch matches."""
+    return pa.schema([(c.name, _arrow_type(c)) for c in columns])
+
+
+def iter_arrow(chunks, schema):
+    """Arrow IPC stream: the schema message, then one record batch per chunk."""
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate(0)
+        return data
+
+    yield drain()
+    for _, rows in chunks:
+        arrays = [
+            pa.array(
+                [float(v) if isinstance(v, Decimal) else v for v in values]
+                if field.type == pa.float64() else list(values),
+                type=field.type,
+            )
+            for field, values in zip(schema, zip(*rows))
+        ]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield drain()
+    writer.close()
+    yield drain()
@@ -0,0 +1,32 @@
+from datetime import date
+
+from models.crm_analysis import CRMAnalysis as CRMAnalysisModel
+
+
+def apply_dashboard_filters(
+    query,
+    start_date: date | None,
+    end_date: date | None,
+    phone: str | None,
+    name: str | None,
+    r_score: int | None,
+    f_score: int | None,
+    m_score: int | None,
+):
+    """Apply the dashboard query-string filters shared by every endpoint."""
+    # date filters (use whichever date field makes sense – e.g. FIRST_IN_DATE)
+    if start_date:
+        query = query.filter(CRMAnalysisModel.FIRST_IN_DATE >= start_date)
+    if end_date:
+        query = query.filter(CRMAnalysisModel.FIRST_IN_DATE <= end_date)
+    if phone:
+        query = query.filter(CRMAnalysisModel.CUST_MOBILENO == phone)
+    if name:
+        query = query.filter(CRMAnalysisModel.CUSTOMER_NAME == name)
+    if r_score is not None:
+        query = query.filter(CRMAnalysisModel.R_SCORE == r_score)
+    if f_score is not None:
+        query = query.filter(CRMAnalysisModel.F_SCORE == f_score)
+    if m_score is not None:
+        query = query.filter(CRMAnalysisModel.M_SCORE == m_score)
+    return query
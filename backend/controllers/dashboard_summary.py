@@ -0,0 +1,224 @@
+"""Pre-aggregated dashboard summary (``crm_dashboard_summary``).
+
+Counts are grouped by the dashboard filter dimensions – R/F/M score, segment,
+FIRST_IN_DATE month – plus the "Days to Return" bucket, so chart requests
+become small lookups instead of crm_analysis scans.  The table is refreshed
+incrementally: only FIRST_IN_DATE months containing rows with a
+DATA_UPDATED_TIME newer than the stored watermark, or whose customer count no
+longer matches crm_analysis (deleted rows), are rebuilt.  Refreshes run in the
+background – on every data reload and every SUMMARY_CHECK_SECONDS – and a full
+rebuild is done every SUMMARY_FULL_REBUILD_HOURS as a backstop.
+"""
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.crm_analysis import CRMAnalysis as CRMAnalysisModel
+from models.dashboard_summary import CRMDashboardSummary, CRMDashboardSummaryState
+from utils.background_refresh import BackgroundRefresh
+from utils.data_version import get_data_version, on_data_reload
+
+# how often the summary is re-checked for deletes between data reloads
+SUMMARY_CHECK_SECONDS = float(os.getenv("SUMMARY_CHECK_SECONDS", "3600"))
+SUMMARY_FULL_REBUILD_HOURS = float(os.getenv("SUMMARY_FULL_REBUILD_HOURS", "24"))
+
+# "Days to Return" ladder: (upper bound in days, label); anything above is ">2 Yr".
+DAYS_BUCKETS = [
+    (30, "1 Month"),
+    (60, "1-2 Month"),
+    (90, "2-3 Month"),
+    (180, "3-6 Month"),
+    (365, "6 Month-1 Yr"),
+    (730, "1-2 Yr"),
+]
+DAYS_BUCKET_OVERFLOW = ">2 Yr"
+
+_STATE_ID = 1
+
+# data version the summary is known to be current for (per process), and
+# when this process last rebuilt it in full
+_ready = {"version": None, "full_at": time.monotonic()}
+
+
+def days_bucket_expr():
+    """SQL CASE mapping DAYS onto the "Days to Return" bucket labels."""
+    days = func.coalesce(CRMAnalysisModel.DAYS, 0)
+    return case(
+        *[(days <= upper, label) for upper, label in DAYS_BUCKETS],
+        else_=DAYS_BUCKET_OVERFLOW,
+    )
+
+
+def _month_expr():
+    return func.date_format(CRMAnalysisModel.FIRST_IN_DATE, "%Y-%m-01")
+
+
+def _summary_select():
+    month = _month_expr()
+    bucket = days_bucket_expr()
+    group_cols = [
+        CRMAnalysisModel.R_SCORE,
+        CRMAnalysisModel.F_SCORE,
+        CRMAnalysisModel.M_SCORE,
+        CRMAnalysisModel.SEGMENT_MAP,
+    ]
+    return select(
+        *group_cols,
+        month,
+        bucket,
+        func.count(),
+    ).group_by(*group_cols, month, bucket)
+
+
+# insert order matching _summary_select()
+_SUMMARY_COLUMNS = [
+    "R_SCORE", "F_SCORE", "M_SCORE", "SEGMENT_MAP", "FIRST_IN_MONTH", "DAYS_BUCKET",
+    "CUSTOMER_COUNT",
+]
+
+
+def _months_with_changed_counts(db: Session) -> set:
+    """FIRST_IN_DATE months whose summary total differs from crm_analysis ("YYYY-MM-01" or None)."""
+    table = CRMDashboardSummary.__table__
+    month = _month_expr()
+    actual = {
+        None if m is None else str(m)[:10]: n
+        for m, n in db.query(month, func.count()).group_by(month)
+    }
+    summarised = {
+        None if m is None else str(m)[:10]: int(n)
+        for m, n in db.query(table.c.FIRST_IN_MONTH, func.sum(table.c.CUSTOMER_COUNT))
+        .group_by(table.c.FIRST_IN_MONTH)
+    }
+    return {m for m in actual.keys() | summarised.keys() if actual.get(m) != summarised.get(m)}
+
+
+def refresh_dashboard_summary(db: Session, full: bool = False) -> bool:
+    """Fold crm_analysis rows newer than the watermark (and deletes) into the summary.
+
+    Returns True when the summary table was rewritten.  The state row is
+    locked for the duration so concurrent workers refresh one at a time.
+    """
+    state = (
+        db.query(CRMDashboardSummaryState)
+        .filter(CRMDashboardSummaryState.id == _STATE_ID)
+        .with_for_update()
+        .first()
+    )
+    if state is None:
+        state = CRMDashboardSummaryState(id=_STATE_ID)
+        db.add(state)
+        full = True
+    elif state.DATA_UPDATED_TIME is None:
+        full = True
+
+    latest = db.query(func.max(CRMAnalysisModel.DATA_UPDATED_TIME)).scalar()
+
+    table = CRMDashboardSummary.__table__
+    source = _summary_select()
+
+    if full:
+        db.execute(table.delete())
+    else:
+        # FIRST_IN_DATE is fixed per customer, so a reloaded row can only
+        # change the counts of its own month partition; a deleted row only
+        # shows up as a month whose total no longer matches.
+        months = _months_with_changed_counts(db)
+        if latest is not None and latest > state.DATA_UPDATED_TIME:
+            months.update(
+                m if m is None else str(m)[:10] for (m,) in db.query(_month_expr())
+                .filter(CRMAnalysisModel.DATA_UPDATED_TIME > state.DATA_UPDATED_TIME)
+                .distinct()
+            )
+        if not months:
+            db.rollback()
+            return False
+        dated = [m for m in months if m is not None]
+        target, changed = [], []
+        if dated:
+            target.append(table.c.FIRST_IN_MONTH.in_(dated))
+            changed.append(_month_expr().in_(dated))
+        if len(dated) < len(months):
+            target.append(table.c.FIRST_IN_MONTH.is_(None))
+            changed.append(CRMAnalysisModel.FIRST_IN_DATE.is_(None))
+        db.execute(table.delete().where(or_(*target)))
+        source = source.where(or_(*changed))
+
+    db.execute(table.insert().from_select(_SUMMARY_COLUMNS, source))
+    state.DATA_UPDATED_TIME = latest
+    state.REFRESHED_AT = datetime.now()
+    db.commit()
+    print(f"Dashboard summary refreshed ({'full' if full else 'incremental'}) up to {latest}")
+    return True
+
+
+def _refresh(version):
+    full = time.monotonic() - _ready["full_at"] >= SUMMARY_FULL_REBUILD_HOURS * 3600
+    db = SessionLocal()
+    try:
+        refresh_dashboard_summary(db, full=full)
+        if full:
+            _ready["full_at"] = time.monotonic()
+        _ready["version"] = version
+    finally:
+        db.close()
+
+
+_refresher = BackgroundRefresh("dashboard-summary-refresh", _refresh, every_seconds=SUMMARY_CHECK_SECONDS)
+
+
+@on_data_reload
+def _refresh_on_reload(version):
+    # until the refresh finishes, summary_available() is False and the
+    # dashboard reads crm_analysis
+    _refresher.request(version)
+
+
+def summary_available(
+    db: Session,
+    start_date: date | None,
+    end_date: date | None,
+    phone: str | None,
+    name: str | None,
+) -> bool:
+    """True when the summary is current and can answer these filters exactly.
+
+    Phone/name filters are per customer and date filters must cover whole
+    FIRST_IN_DATE months; anything else falls back to crm_analysis.
+    """
+    if phone or name:
+        return False
+    if start_date and start_date.day != 1:
+        return False
+    if end_date and (end_date + timedelta(days=1)).day != 1:
+        return False
+    version = get_data_version(db)
+    return version is not None and _ready["version"] == version
+
+
+def summary_query(
+    db: Session,
+    *columns,
+    start_date: date | None = None,
+    end_date: date | None = None,
+    r_score: int | None = None,
+    f_score: int | None = None,
+    m_score: int | None = None,
+):
+    """Query ``columns`` from the summary with the dashboard filters applied."""
+    query = db.query(*columns)
+    if start_date:
+        query = query.filter(CRMDashboardSummary.FIRST_IN_MONTH >= start_date)
+    if end_date:
+        query = query.filter(CRMDashboardSummary.FIRST_IN_MONTH <= end_date)
+    if r_score is not None:
+        query = query.filter(CRMDashboardSummary.R_SCORE == r_score)
+    if f_score is not None:
+        query = query.filter(CRMDashboardSummary.F_SCORE == f_score)
+    if m_score is not None:
+        query = query.filter(CRMDashboardSummary.M_SCORE == m_score)
+    return query
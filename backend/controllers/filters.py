@@ -1,25 +1,66 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
 
 from database import get_db
 from models.crm_analysis import CRMAnalysis as CRMAnalysisModel
 from schemas.filters import FilterOptions
+from utils.crm_snapshot import get_snapshot
+from utils.response_cache import cached_json_response
+from utils.typeahead import prefix_search
 
 router = APIRouter(prefix="/filters", tags=["filters"])
 
+SEARCH_LIMIT_DEFAULT = 20
+SEARCH_LIMIT_MAX = 200
+
 
 # @router.get("/", response_model=FilterOptions)
 @router.get("", response_model=FilterOptions)
-def get_filter_options(db: Session = Depends(get_db)) -> FilterOptions:
-    """Return distinct field values used for dashboard filters."""
+def get_filter_options(request: Request, db: Session = Depends(get_db)) -> FilterOptions:
+    """Return the low-cardinality dashboard filter values.
+
+    Phones and names are looked up through ``/filters/phones`` and
+    ``/filters/names`` instead of being shipped in full.
+    """
+
+    snapshot = get_snapshot(db)
 
     def distinct(column):
+        if snapshot is not None:
+            return snapshot.distinct(column.key)
         return [value for (value,) in db.query(column).filter(column.isnot(None)).distinct().all()]
 
-    return {
-        "phones": distinct(CRMAnalysisModel.CUST_MOBILENO),
-        "names": distinct(CRMAnalysisModel.CUSTOMER_NAME),
-        "r_values": distinct(CRMAnalysisModel.R_SCORE),
-        "f_values": distinct(CRMAnalysisModel.F_SCORE),
-        "m_values": distinct(CRMAnalysisModel.M_SCORE),
-    }
\ No newline at end of file
+    def build():
+        return {
+            "r_values": distinct(CRMAnalysisModel.R_SCORE),
+            "f_values": distinct(CRMAnalysisModel.F_SCORE),
+            "m_values": distinct(CRMAnalysisModel.M_SCORE),
+        }
+
+    return cached_json_response(request, db, build)
+
+
+@router.get("/phones", response_model=list[str])
+def search_phones(
+    request: Request,
+    q: str = Query("", description="Mobile number prefix"),
+    limit: int = Query(SEARCH_LIMIT_DEFAULT, ge=1, le=SEARCH_LIMIT_MAX),
+    db: Session = Depends(get_db),
+):
+    """Customer mobile numbers starting with ``q``."""
+    return cached_json_response(
+        request, db, lambda: prefix_search(db, CRMAnalysisModel.CUST_MOBILENO, q.strip(), limit)
+    )
+
+
+@router.get("/names", response_model=list[str])
+def search_names(
+    request: Request,
+    q: str = Query("", description="Customer name prefix (case-insensitive)"),
+    limit: int = Query(SEARCH_LIMIT_DEFAULT, ge=1, le=SEARCH_LIMIT_MAX),
+    db: Session = Depends(get_db),
+):
+    """Customer names starting with ``q``."""
+    return cached_json_response(
+        request, db, lambda: prefix_search(db, CRMAnalysisModel.CUSTOMER_NAME, q.strip(), limit)
+    )
@@ -9,6 +9,8 @@ from routers.campaign.campaign_router import router as campaign_router
 from models.campaign.campaign_model import Base as CampaignBase
 from routers.campaign.template_router import router as templates_router
 from dotenv import load_dotenv
+from utils.data_version import get_data_version
+from controllers.campaign.campaign_filter_values import backfill_campaign_filter_values
 
 load_dotenv()
 # print(">>> FastAPI is starting <<<", flush=True)
@@ -23,6 +25,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Truncated", "X-Next-Cursor"],
 )
 
 
@@ -46,6 +49,18 @@ app.include_router(campaign_router, prefix="/api")
 app.include_router(templates_router, prefix="/api")
 
 
+@app.on_event("startup")
+def warm_data_caches():
+    # Reads the CRM data version once so reload listeners (dashboard summary, …)
+    # build their state before the first request instead of during it.
+    get_data_version(force=True)
+
+
+@app.on_event("startup")
+def backfill_campaign_filters():
+    backfill_campaign_filter_values()
+
+
 @app.get("/")
 def root():
     return {"message": "RFM Tool API with Authentication"}
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from database import Base
+
+
+class CampaignAudience(Base):
+    """Audience frozen for a campaign run: one row per customer, all from one data version."""
+
+    __tablename__ = "campaign_audience"
+
+    campaign_id      = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), primary_key=True)
+    CUST_MOBILENO    = Column('CUST_MOBILENO', String(60), primary_key=True)
+    snapshot_version = Column(String(40), nullable=True)
+
+
+class CampaignAudienceFreeze(Base):
+    """One row per frozen campaign, so an empty frozen audience is still 'frozen'."""
+
+    __tablename__ = "campaign_audience_freeze"
+
+    campaign_id      = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), primary_key=True)
+    snapshot_version = Column(String(40), nullable=True)
+    customers        = Column(Integer, nullable=False, default=0)
+    frozen_at        = Column(DateTime, nullable=True)
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from database import Base
+
+
+class CampaignFilterValue(Base):
+    """One row per value selected in a campaign's list filters (branch, section, r_score, …)."""
+
+    __tablename__ = "campaign_filter_values"
+
+    campaign_id = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), primary_key=True)
+    dimension   = Column(String(40), primary_key=True)
+    value       = Column(String(255), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_campaign_filter_values_dimension_value", "dimension", "value"),
+    )
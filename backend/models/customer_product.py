@@ -0,0 +1,42 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, Numeric, Index
+from database import Base
+
+
+class CRMCustomerProduct(Base):
+    """crm_sales folded to one row per customer × product leaf (brand … item)."""
+
+    __tablename__ = "crm_customer_product"
+
+    id                  = Column(Integer, primary_key=True, autoincrement=True)
+    CUST_MOBILENO       = Column('CUST_MOBILENO', String(60), nullable=False)
+    BRAND               = Column('BRAND', String(100), nullable=True)
+    SECTION             = Column('SECTION', String(100), nullable=True)
+    PRODUCT             = Column('PRODUCT', String(100), nullable=True)
+    MODELNO             = Column('MODELNO', String(100), nullable=True)
+    ITEM_CODE           = Column('ITEM_CODE', String(100), nullable=True)
+    ITEM_DESCRIPTION    = Column('ITEM_DESCRIPTION', String(255), nullable=True)
+
+    TOTAL_SALES         = Column('TOTAL_SALES', Numeric(53, 2), default=0.00)
+    # largest single crm_sales line, so "a line worth >= X" filters stay exact
+    MAX_LINE_SALES      = Column('MAX_LINE_SALES', Numeric(53, 2), default=0.00)
+    LINE_COUNT          = Column('LINE_COUNT', Integer, default=0)
+    FIRST_PURCHASE_DATE = Column('FIRST_PURCHASE_DATE', Date, nullable=True)
+    LAST_PURCHASE_DATE  = Column('LAST_PURCHASE_DATE', Date, nullable=True)
+
+    __table_args__ = (
+        Index("ix_crm_customer_product_customer", "CUST_MOBILENO", "BRAND", "SECTION"),
+        Index("ix_crm_customer_product_hierarchy", "BRAND", "SECTION", "PRODUCT", "CUST_MOBILENO"),
+        Index("ix_crm_customer_product_model", "MODELNO"),
+        Index("ix_crm_customer_product_item", "ITEM_CODE"),
+        Index("ix_crm_customer_product_item_desc", "ITEM_DESCRIPTION"),
+    )
+
+
+class CRMCustomerProductState(Base):
+    """Single-row watermark: the latest crm_sales INVOICE_DATE folded into the fact table."""
+
+    __tablename__ = "crm_customer_product_state"
+
+    id           = Column(Integer, primary_key=True)
+    INVOICE_DATE = Column('INVOICE_DATE', Date, nullable=True)
+    REFRESHED_AT = Column('REFRESHED_AT', DateTime, nullable=True)
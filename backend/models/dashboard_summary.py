@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, Index
+from database import Base
+
+
+class CRMDashboardSummary(Base):
+    """Pre-aggregated crm_analysis counts keyed by the dashboard filter dimensions."""
+
+    __tablename__ = "crm_dashboard_summary"
+
+    id              = Column(Integer, primary_key=True, autoincrement=True)
+    R_SCORE         = Column('R_SCORE', Integer, nullable=True)
+    F_SCORE         = Column('F_SCORE', Integer, nullable=True)
+    M_SCORE         = Column('M_SCORE', Integer, nullable=True)
+    SEGMENT_MAP     = Column('SEGMENT_MAP', String(255), nullable=True)
+    FIRST_IN_MONTH  = Column('FIRST_IN_MONTH', Date, nullable=True)
+    DAYS_BUCKET     = Column('DAYS_BUCKET', String(20), nullable=False)
+
+    CUSTOMER_COUNT  = Column('CUSTOMER_COUNT', Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_crm_dashboard_summary_month", "FIRST_IN_MONTH"),
+        Index("ix_crm_dashboard_summary_rfm", "R_SCORE", "F_SCORE", "M_SCORE"),
+    )
+
+
+class CRMDashboardSummaryState(Base):
+    """Single-row watermark: the DATA_UPDATED_TIME already folded into the summary."""
+
+    __tablename__ = "crm_dashboard_summary_state"
+
+    id                = Column(Integer, primary_key=True)
+    DATA_UPDATED_TIME = Column('DATA_UPDATED_TIME', DateTime, nullable=True)
+    REFRESHED_AT      = Column('REFRESHED_AT', DateTime, nullable=True)
@@ -1,11 +1,11 @@
 from datetime import date
 import io
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File, WebSocket
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import os
 from io import StringIO
 import csv
@@ -16,7 +16,9 @@ from models.campaign.upload_contact_model import CampaignUpload
 from controllers.campaign.campaign_controller import (
     create_campaign,
     get_campaign_options,
+    get_brand_cascade,
     get_campaign_run_count_from_request,
+    get_campaign_run_facets,
     list_campaigns,
     get_campaign,
     update_campaign,
@@ -26,18 +28,29 @@ from controllers.campaign.campaign_controller import (
     export_crm_numbers,
     generate_upload_template,
     get_mobile_numbers,
+    estimate_mobile_numbers,
 )
 from schemas.campaign.campaign_schema import (
     CampaignCreate,
     Campaign as CampaignOut,
     CampaignListOut,
     CampaignOptions,
+    CampaignAudienceInfo,
     CampaignRunDetails,
+    CampaignRunFacets,
     CampaignRunFilters,
     )
 from database import SessionLocal
 from typing import List, Optional
 from utils.whatsapp import send_whatsapp_message
+from controllers.campaign.campaign_filter_values import get_campaigns_targeting
+from controllers.campaign.campaign_audience import freeze_campaign_audience, get_campaign_audience_info
+from controllers.campaign.live_count import serve_live_count
+from utils.response_cache import cached_json_response
+from utils.xlsx_stream import XLSX_MEDIA_TYPE
+from utils.query_budget import DOWNLOAD_BUDGET_MS, QueryCancelled, QueryTimeout, run_cancellable
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 import pandas as pd
 
 
@@ -96,13 +109,13 @@ def download_upload_template_route():
 def download_campaign_contacts(
     campaign_id: int, db: Session = Depends(get_db)
 ):
-    buffer = export_upload_contacts(db, campaign_id)
+    content = export_upload_contacts(db, campaign_id)
     headers = {
         "Content-Disposition": f"attachment; filename=campaign_{campaign_id}_contacts.xlsx"
     }
     return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        content,
+        media_type=XLSX_MEDIA_TYPE,
         headers=headers,
     )
 
@@ -120,8 +133,21 @@ def get_upload_numbers_route(campaign_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/options", response_model=CampaignOptions)
-def read_campaign_options(db: Session = Depends(get_db)):
-    return get_campaign_options(db)
+def read_campaign_options(request: Request, db: Session = Depends(get_db)):
+    return cached_json_response(request, db, lambda: get_campaign_options(db))
+
+@router.get("/brand-cascade")
+def read_brand_cascade(
+    request: Request,
+    brand: List[str] = Query([]),
+    section: List[str] = Query([]),
+    product: List[str] = Query([]),
+    model: List[str] = Query([]),
+    db: Session = Depends(get_db),
+):
+    """Brand hierarchy values still valid under the selected brands/sections/products/models."""
+    selected = {"brand": brand, "section": section, "product": product, "model": model}
+    return cached_json_response(request, db, lambda: get_brand_cascade(db, selected))
 
 @router.post("/createCampaign", response_model=CampaignOut)
 def create_campaign_route(
@@ -155,6 +181,19 @@ def read_campaigns(db: Session = Depends(get_db)):
     return list_campaigns(db)
 
 
+@router.get("/targeting", response_model=List[CampaignListOut])
+def read_campaigns_targeting(
+    dimension: str = Query(..., description="Campaign filter, e.g. branch, section, r_score"),
+    value: str = Query(...),
+    db: Session = Depends(get_db),
+):
+    """Campaigns whose filter ``dimension`` includes ``value``."""
+    try:
+        return get_campaigns_targeting(db, dimension, value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/{campaign_id}", response_model=CampaignOut)
 def read_campaign(campaign_id: int, db: Session = Depends(get_db)):
     campaign = get_campaign(db, campaign_id)
@@ -169,16 +208,58 @@ def read_campaign_run_details(campaign_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Campaign not found")
     return details
 
+
+@router.get("/run/{campaign_id}/audience", response_model=Optional[CampaignAudienceInfo])
+def read_campaign_audience(campaign_id: int, db: Session = Depends(get_db)):
+    """Frozen run audience (size and data version), or null before the first freeze."""
+    return get_campaign_audience_info(db, campaign_id)
+
+
+@router.post("/run/{campaign_id}/audience/freeze", response_model=CampaignAudienceInfo)
+def freeze_campaign_audience_route(campaign_id: int, db: Session = Depends(get_db)):
+    """Re-resolve the campaign's audience against current data and freeze it for the run."""
+    return freeze_campaign_audience(db, campaign_id)
+
 @router.post("/run/count")
-def get_campaign_run_count(filters: CampaignRunFilters, db: Session = Depends(get_db)):
+async def get_campaign_run_count(
+    filters: CampaignRunFilters,
+    request: Request,
+    approximate: bool = Query(False, description="HyperLogLog estimate instead of an exact count"),
+    db: Session = Depends(get_db),
+):
     try:
-        result = get_campaign_run_count_from_request(
+        result = await run_cancellable(
+            request,
             db,
-            filters.model_dump(exclude_none=True)  # ✅ Pydantic v2
+            lambda: get_campaign_run_count_from_request(
+                db,
+                filters.model_dump(exclude_none=True),  # ✅ Pydantic v2
+                approximate=approximate,
+            ),
         )
-        # result already has {"total_customers": X, "shortlisted_customers": Y}
+        # result already has {"total_customers": X, "shortlisted_customers": Y, "data_version": V};
+        # over budget it is a sampled estimate with "estimated", "low" and "high"
         return result
 
+    except QueryCancelled:
+        return Response(status_code=499)  # client closed the request
+    except QueryTimeout as e:
+        raise HTTPException(status_code=504, detail=f"Audience count timed out: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.websocket("/run/live")
+async def live_campaign_run_count(websocket: WebSocket):
+    """Debounced audience counts for filter deltas pushed by the Create Campaign form."""
+    await serve_live_count(websocket)
+
+
+@router.post("/run/facets", response_model=CampaignRunFacets)
+def get_campaign_run_facets_route(filters: CampaignRunFilters, db: Session = Depends(get_db)):
+    """Shortlist breakdown by segment, store, city, state and R/F/M score for one filter set."""
+    try:
+        return get_campaign_run_facets(db, filters.model_dump(exclude_none=True))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -347,56 +428,62 @@ def send_whatsapp(req: WhatsAppMessage):
 
 @router.get("/run/{campaign_id}/numbers/download")
 def download_campaign_numbers(campaign_id: int, db: Session = Depends(get_db)):
-    buffer = export_crm_numbers(db, campaign_id)
+    content = export_crm_numbers(db, campaign_id)
     headers = {
         "Content-Disposition": f"attachment; filename=campaign_{campaign_id}_numbers.xlsx"
     }
     return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        content,
+        media_type=XLSX_MEDIA_TYPE,
         headers=headers,
     )
 
 
 @router.post("/download-numbers")
-def download_numbers_route(filters: NumberDownloadFilters, db: Session = Depends(get_db)):
+async def download_numbers_route(filters: NumberDownloadFilters, request: Request, db: Session = Depends(get_db)):
 
-    rows = get_mobile_numbers(db, filters)
-  
+    # rows are read with an unbuffered cursor on a dedicated connection; the
+    # budget bounds the wait for the first chunk, not the whole download
+    stream = get_mobile_numbers(filters)
+    await run_in_threadpool(stream.connect)
+    try:
+        await run_cancellable(request, stream.conn, lambda: stream.start(DOWNLOAD_BUDGET_MS))
+    except QueryCancelled:
+        stream.close()
+        return Response(status_code=499)  # client closed the request
+    except QueryTimeout:
+        stream.close()
+        # tell the user roughly how big the list is instead of hanging
+        try:
+            estimate = await run_in_threadpool(estimate_mobile_numbers, db, filters)
+        except QueryTimeout:
+            estimate = {}
+        return JSONResponse(
+            status_code=504,
+            content={"detail": "Download timed out; narrow the filters and try again.", **estimate},
+        )
 
     def iter_csv():
         buffer = StringIO(newline="")
         writer = csv.writer(buffer)
-
-        # header
-       # writer.writerow(["mobile_no", "name", "segment"])
-        writer.writerow(rows.keys())
+        writer.writerow(stream.keys)
         yield buffer.getvalue()
         buffer.seek(0)
         buffer.truncate(0)
 
-        # rows in batches
-        batch = []
-        for r in rows:
-            #batch.append([r[0], r[1], r[2]])
-            batch.append(list(r))  # row as list of values
-            if len(batch) >= 1000:  # flush every 1000 rows
-                writer.writerows(batch)
-                yield buffer.getvalue()
-                buffer.seek(0)
-                buffer.truncate(0)
-                batch = []
-
-        # flush remaining
-        if batch:
-            writer.writerows(batch)
+        # one chunk of the server-side cursor at a time
+        for rows in stream.chunks():
+            writer.writerows(rows)
             yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
 
     headers = {"Content-Disposition": "attachment; filename=numbers.csv"}
     return StreamingResponse(
         iter_csv(),
         media_type="text/csv",
-        headers=headers
+        headers=headers,
+        background=BackgroundTask(stream.close),  # no-op unless the body never ran
     )
 
     
\ No newline at end of file
@@ -3,7 +3,6 @@ import re
 import requests
 from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import text
 from controllers.auth import get_current_user
 from models.user import User
 from database import get_db
@@ -19,6 +18,7 @@ from utils.api_endpoints import (
 )
 from dotenv import load_dotenv
 from models.campaign.template_detail_model import template_details
+from controllers.campaign.campaign_audience import get_campaign_audience_numbers
 from sqlalchemy.orm import Session
 
 # Load environment variables from .env
@@ -584,48 +584,15 @@ async def get_template_details(template_name: str, db: Session = Depends(get_db)
 
 def get_eligible_customers(campaign_id: int, basedon:str,db: Session = Depends(get_db)):
     print("campaign_id------ ",campaign_id)
-    sql = text("""
-        SELECT 
-            ca.CUST_MOBILENO
-        FROM campaigns c
-        JOIN crm_analysis ca 
-            ON 1=1
-        LEFT JOIN crm_sales cs 
-            ON cs.CUST_MOBILENO = ca.CUST_MOBILENO
-        WHERE 
-            c.id = :campaign_id
-            AND (
-                (
-                    c.rfm_segments IS NOT NULL 
-                    AND JSON_CONTAINS(c.rfm_segments, JSON_QUOTE(ca.SEGMENT_MAP), '$')
-                )
-                OR (
-                    (c.r_score IS NULL OR JSON_CONTAINS(c.r_score, JSON_ARRAY(ca.R_SCORE), '$'))
-                    AND (c.f_score IS NULL OR JSON_CONTAINS(c.f_score, JSON_ARRAY(ca.F_SCORE), '$'))
-                    AND (c.m_score IS NULL OR JSON_CONTAINS(c.m_score, JSON_ARRAY(ca.M_SCORE), '$'))
-                    AND (c.recency_min IS NULL OR c.recency_max IS NULL OR (ca.DAYS BETWEEN c.recency_min AND c.recency_max))
-                    AND (c.frequency_min IS NULL OR c.frequency_max IS NULL OR (ca.F_VALUE BETWEEN c.frequency_min AND c.frequency_max))
-                    AND (c.monetary_min IS NULL OR c.monetary_max IS NULL OR (ca.M_VALUE BETWEEN c.monetary_min AND c.monetary_max))
-                )
-            )
-            AND (c.branch IS NULL OR JSON_CONTAINS(c.branch, JSON_QUOTE(ca.LAST_IN_STORE_CODE), '$'))
-            AND (c.city IS NULL OR JSON_CONTAINS(c.city, JSON_QUOTE(ca.LAST_IN_STORE_CITY), '$'))
-            AND (c.state IS NULL OR JSON_CONTAINS(c.state, JSON_QUOTE(ca.LAST_IN_STORE_STATE), '$'))
-            AND (c.section IS NULL OR JSON_CONTAINS(c.section, JSON_QUOTE(cs.SECTION), '$'))
-            AND (c.product IS NULL OR JSON_CONTAINS(c.product, JSON_QUOTE(cs.PRODUCT), '$'))
-            AND (c.model IS NULL OR JSON_CONTAINS(c.model, JSON_QUOTE(cs.MODELNO), '$'))
-            AND (c.item IS NULL OR JSON_CONTAINS(c.item, JSON_QUOTE(cs.ITEM_DESCRIPTION), '$'))
-    """)
-
-    #result = db.execute(sql, {"campaign_id": campaign_id}).fetchall()
-    result = db.execute(sql, {"campaign_id": campaign_id}).fetchall()
+    # every send of a run reads the same frozen audience (frozen on first use)
+    result = get_campaign_audience_numbers(db, campaign_id)
 
     if not result:
         # raise HTTPException(status_code=404, detail="No eligible customers found")
         numbers_str=""
     else:
     # format numbers with 91 prefix and comma separator
-        numbers = [f"91{row.CUST_MOBILENO}" for row in result if row.CUST_MOBILENO]
+        numbers = [f"91{mobile}" for mobile in result if mobile]
         numbers_str = ",".join(numbers)
         print("numbers_str--------------- ",numbers_str)
     
@@ -1,5 +1,5 @@
 from datetime import date, datetime
-from typing import List, Optional, Dict,Any
+from typing import List, Optional, Dict,Any, Union
 from pydantic import BaseModel
 
 class CampaignBase(BaseModel):
@@ -64,7 +64,8 @@ class CampaignOptions(BaseModel):
     products:         List[str]
     models:           List[str]
     items:            List[str]
-    brand_hierarchy:  List[Dict[str, Optional[str]]]
+    # kept for older clients; use GET /campaign/brand-cascade instead
+    brand_hierarchy:  List[Dict[str, Optional[str]]] = []
 
     class Config:
         from_attributes = True
@@ -118,6 +119,8 @@ class CampaignRunDetails(BaseModel):
     rfm_segment_label: str
     brand_label: str
     shortlisted_count: int
+    # data version of the frozen run audience (None until the run is frozen)
+    audience_version: Optional[str] = None
 class Config:
     from_attributes = True
 
@@ -151,4 +154,25 @@ class CampaignRunFilters(BaseModel):
     birthday_start: Optional[str] = None
     birthday_end: Optional[str] = None
     anniversary_start: Optional[str] = None
-    anniversary_end: Optional[str] = None
\ No newline at end of file
+    anniversary_end: Optional[str] = None
+
+
+class AudienceFacetValue(BaseModel):
+    value: Union[int, str]
+    customers: int
+
+class CampaignRunFacets(BaseModel):
+    total_customers: int
+    shortlisted_customers: int
+    # segment, branch (store code), city, state, r_score, f_score, m_score
+    facets: Dict[str, List[AudienceFacetValue]]
+    data_version: Optional[str] = None
+
+
+class CampaignAudienceInfo(BaseModel):
+    campaign_id: int
+    customers: int
+    snapshot_version: Optional[str] = None
+    frozen_at: Optional[datetime] = None
+    # False once data was reloaded after the freeze; the next send re-freezes
+    current: bool = True
@@ -3,8 +3,9 @@ from pydantic import BaseModel
 
 
 class FilterOptions(BaseModel):
-    phones: List[str]
-    names: List[str]
+    # phones/names are served by the /filters/phones and /filters/names search endpoints
+    phones: List[str] = []
+    names: List[str] = []
     r_values: List[int]
     f_values: List[int]
-    m_values: List[int]
\ No newline at end of file
+    m_values: List[int]
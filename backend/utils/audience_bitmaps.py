@@ -0,0 +1,218 @@
+"""Roaring-bitmap audience index for campaign counts.
+
+Every customer's dense id is its row in the crm_analysis snapshot.  The index
+keeps one compressed bitmap per value of segment, R/F/M score, store code,
+city and state, and one per distinct purchase path (brand, section, product,
+model, item) in crm_customer_product, so product filters still have to match
+on the same purchase.  A shortlist count is then a handful of bitmap
+OR/ANDs; range filters (recency, frequency, monetary, birthday, anniversary)
+are checked with NumPy on the surviving ids only.
+
+The index is built in the background after each snapshot load and is optional:
+it needs pyroaring and the snapshot, and :meth:`AudienceIndex.count` returns
+None for filters it cannot answer (the value threshold needs line amounts);
+:meth:`AudienceIndex.ids` returns the matching snapshot rows for breakdowns.
+"""
+import threading
+import time
+
+from sqlalchemy import text
+
+from utils.crm_snapshot import get_snapshot, np
+from utils.db_stream import stream_chunks
+
+try:
+    from pyroaring import BitMap
+except ImportError:  # the bitmap index is an optional accelerator
+    BitMap = None
+
+SALES_LEVELS = ("brand", "section", "product", "model", "item")
+
+_SALES_PATHS_SQL = text("""
+    SELECT DISTINCT CUST_MOBILENO, BRAND, SECTION, PRODUCT, MODELNO, ITEM_CODE
+    FROM crm_customer_product
+""")
+
+_holder = {"index": None, "building": None, "failed": None}
+_lock = threading.Lock()
+
+
+def _bitmaps_by_code(codes) -> dict:
+    """{code: BitMap of rows holding it}, NULL codes (< 0 / NaN) skipped."""
+    order = np.argsort(codes, kind="stable")
+    ordered = codes[order]
+    values, starts = np.unique(ordered, return_index=True)
+    ends = list(starts[1:]) + [len(ordered)]
+    return {
+        value: BitMap(order[start:end].astype(np.uint32))
+        for value, start, end in zip(values.tolist(), starts.tolist(), ends)
+        if value == value and value >= 0
+    }
+
+
+class AudienceIndex:
+    """Value → customer bitmaps for one snapshot version."""
+
+    def __init__(self, snapshot, sales_paths: dict):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        self.all = BitMap(range(snapshot.size))
+
+        self.values = {}
+        for key, column in (
+            ("segment", "SEGMENT_MAP"),
+            ("branch", "LAST_IN_STORE_CODE"),
+            ("city", "LAST_IN_STORE_CITY"),
+            ("state", "LAST_IN_STORE_STATE"),
+        ):
+            cat = snapshot.cat[column]
+            self.values[key] = {
+                cat.categories[code]: bitmap
+                for code, bitmap in _bitmaps_by_code(cat.codes).items()
+            }
+        for key, column in (("r_score", "R_SCORE"), ("f_score", "F_SCORE"), ("m_score", "M_SCORE")):
+            self.values[key] = {int(v): b for v, b in _bitmaps_by_code(snapshot.num[column]).items()}
+
+        # one bitmap per distinct sales path, plus level value → path ids
+        self.paths = list(sales_paths)
+        self.path_bitmaps = [BitMap(sales_paths[p]) for p in self.paths]
+        self.path_ids = {level: {} for level in SALES_LEVELS}
+        for pid, path in enumerate(self.paths):
+            for level, value in zip(SALES_LEVELS, path):
+                self.path_ids[level].setdefault(value, []).append(pid)
+
+    @classmethod
+    def build(cls, snapshot) -> "AudienceIndex":
+        rows = {}
+        row_of_mobile = snapshot.row_of_mobile
+        for _, chunk in stream_chunks(_SALES_PATHS_SQL):
+            for mobile, *path in chunk:
+                row = row_of_mobile.get(mobile)
+                if row is not None:
+                    rows.setdefault(tuple(path), []).append(row)
+        return cls(snapshot, rows)
+
+    def _any_of(self, key: str, wanted) -> "BitMap":
+        bitmaps = [self.values[key][v] for v in wanted if v in self.values[key]]
+        return BitMap.union(*bitmaps) if bitmaps else BitMap()
+
+    def _sales_bitmap(self, filters: dict):
+        """Customers with a sales line matching every product filter, or None if unfiltered."""
+        selected = {
+            "brand": [filters["brand"]] if filters.get("brand") else None,
+            "section": filters.get("section"),
+            "product": filters.get("product"),
+            "model": filters.get("model"),
+            "item": filters.get("item"),
+        }
+        path_sets = [
+            set().union(*(self.path_ids[level].get(v, ()) for v in values))
+            for level, values in selected.items() if values
+        ]
+        if not path_sets:
+            return None
+        pids = set.intersection(*path_sets)
+        bitmaps = [self.path_bitmaps[pid] for pid in pids]
+        return BitMap.union(*bitmaps) if bitmaps else BitMap()
+
+    def _select(self, filters: dict):
+        """(bitmap of value matches, range checks still to apply), or None if unsupported."""
+        if filters.get("value_threshold") is not None:
+            return None
+
+        result = self.all
+        for key in ("branch", "city", "state", "r_score", "f_score", "m_score"):
+            if filters.get(key):
+                result = result & self._any_of(key, filters[key])
+        sales = self._sales_bitmap(filters)
+        if sales is not None:
+            result = result & sales
+
+        # range predicates: checked on the surviving ids only
+        snapshot = self.snapshot
+        checks = []
+        for prefix, column in (("recency", "DAYS"), ("frequency", "F_VALUE"), ("monetary", "M_VALUE")):
+            op = filters.get(f"{prefix}_op")
+            value = filters.get(f"{prefix}_min")
+            if op in (">=", "<=", "=") and value is not None:
+                checks.append((snapshot.num[column], op, value))
+        for prefix, column in (("birthday", "DOB"), ("anniversary", "ANNIV_DT")):
+            start, end = filters.get(f"{prefix}_start"), filters.get(f"{prefix}_end")
+            if start and end:
+                try:
+                    lo, hi = np.datetime64(start, "D"), np.datetime64(end, "D")
+                except ValueError:
+                    return None  # let MySQL interpret unusual date strings
+                checks.append((snapshot.dates[column], ">=", lo))
+                checks.append((snapshot.dates[column], "<=", hi))
+        return result, checks
+
+    def ids(self, filters: dict):
+        """Snapshot row ids of the shortlisted customers, or None if unsupported."""
+        selected = self._select(filters)
+        if selected is None:
+            return None
+        return self._apply_checks(*selected)
+
+    @staticmethod
+    def _apply_checks(result, checks):
+        ids = np.asarray(result.to_array(), dtype=np.int64)
+        if not checks:
+            return ids
+        keep = np.ones(len(ids), dtype=bool)
+        for values, op, value in checks:
+            column = values[ids]
+            if op == ">=":
+                keep &= column >= value
+            elif op == "<=":
+                keep &= column <= value
+            else:
+                keep &= column == value
+        return ids[keep]
+
+    def count(self, filters: dict) -> int | None:
+        """Shortlisted customers for get_campaign_run_count_from_request filters, or None."""
+        selected = self._select(filters)
+        if selected is None:
+            return None
+        result, checks = selected
+        if not checks:
+            return len(result)
+        return len(self._apply_checks(result, checks))
+
+def _build(snapshot):
+    started = time.monotonic()
+    try:
+        index = AudienceIndex.build(snapshot)
+    except Exception as exc:
+        print(f"Audience bitmap index build failed: {exc}")
+        index = None
+    with _lock:
+        _holder["building"] = None
+        if index is None:
+            _holder["failed"] = snapshot  # don't retry until the next snapshot
+            return
+        _holder["index"] = index
+    print(
+        f"Audience bitmap index built: {len(index.paths)} sales paths, version {index.version}, "
+        f"{time.monotonic() - started:.1f}s"
+    )
+
+
+def get_audience_index(db=None, version: str | None = None) -> AudienceIndex | None:
+    """Index matching the current (or ``version``'s) snapshot; starts a background build and returns None if stale."""
+    if BitMap is None:
+        return None
+    snapshot = get_snapshot(db, version)
+    if snapshot is None:
+        return None
+    with _lock:
+        index = _holder["index"]
+        if index is not None and index.snapshot is snapshot:
+            return index
+        if _holder["building"] is not snapshot and _holder["failed"] is not snapshot:
+            _holder["building"] = snapshot
+            threading.Thread(
+                target=_build, args=(snapshot,), name="audience-bitmap-builder", daemon=True
+            ).start()
+    return None
@@ -0,0 +1,225 @@
+"""HyperLogLog sketches for approximate campaign audience counts.
+
+One HLL sketch (2**HLL_PRECISION one-byte registers, ~0.8% standard error) is
+kept per value of segment, store code, city, state, R/F/M score, brand and
+section.  An approximate count unions the sketches of the values chosen in
+each filter (register-wise max, exact for OR) and estimates the intersection
+across filters by inclusion–exclusion over those unions, so an answer costs a
+few register merges regardless of data size.  Intersections of small groups
+carry a larger relative error than unions; callers get a propagated standard
+error with every estimate.
+
+Customers are hashed by their row in the crm_analysis snapshot, so like the
+bitmap index the sketches are rebuilt in the background for every snapshot,
+are optional (NumPy), and answer only filters on the sketched dimensions.
+"""
+import math
+import threading
+import time
+
+from sqlalchemy import text
+
+from utils.crm_snapshot import get_snapshot, np
+from utils.db_stream import stream_chunks
+
+HLL_PRECISION = 14
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_RELATIVE_ERROR = 1.04 / math.sqrt(HLL_REGISTERS)
+_MAX_RANK = 64 - HLL_PRECISION + 1
+
+# run-count filter key → snapshot column
+SNAPSHOT_DIMENSIONS = {
+    "segment": "SEGMENT_MAP",
+    "branch": "LAST_IN_STORE_CODE",
+    "city": "LAST_IN_STORE_CITY",
+    "state": "LAST_IN_STORE_STATE",
+    "r_score": "R_SCORE",
+    "f_score": "F_SCORE",
+    "m_score": "M_SCORE",
+}
+SALES_DIMENSIONS = ("brand", "section")
+SKETCHED_KEYS = (*SNAPSHOT_DIMENSIONS, *SALES_DIMENSIONS)
+
+_SALES_VALUES_SQL = text("""
+    SELECT DISTINCT CUST_MOBILENO, BRAND, SECTION
+    FROM crm_customer_product
+""")
+
+_INVERSE_POWERS = np.exp2(-np.arange(_MAX_RANK + 1, dtype=np.float64)) if np is not None else None
+
+_holder = {"sketches": None, "building": None, "failed": None}
+_lock = threading.Lock()
+
+
+def _hash64(rows):
+    """splitmix64 of row ids: well-mixed 64-bit hashes, vectorised."""
+    z = rows.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _buckets_and_ranks(rows):
+    """HLL register index and rank (leading zeros + 1 of the remaining bits) per row."""
+    h = _hash64(rows)
+    bits = 64 - HLL_PRECISION
+    buckets = (h >> np.uint64(bits)).astype(np.int64)
+    rest = h & np.uint64((1 << bits) - 1)
+    ranks = np.full(len(rows), bits + 1, dtype=np.uint8)
+    nonzero = rest > 0
+    # rest < 2**50 converts to float64 exactly, so floor(log2) is exact
+    ranks[nonzero] = bits - np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.uint8)
+    return buckets, ranks
+
+
+def hll_estimate(registers) -> float:
+    """Cardinality estimate for one register array."""
+    m = HLL_REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    # histogram of register values: far cheaper than 2**-r per register
+    histogram = np.bincount(registers, minlength=_MAX_RANK + 1)
+    estimate = alpha * m * m / float(histogram @ _INVERSE_POWERS[: len(histogram)])
+    zeros = int(histogram[0])
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)  # linear counting for small sets
+    return estimate
+
+
+def _grouped_registers(codes, buckets, ranks, n_codes: int):
+    """(n_codes, m) registers: one sketch per code, rows with code < 0 skipped."""
+    keep = codes >= 0
+    registers = np.zeros((n_codes, HLL_REGISTERS), dtype=np.uint8)
+    np.maximum.at(registers, (codes[keep], buckets[keep]), ranks[keep])
+    return registers
+
+
+class AudienceSketches:
+    """Value → HLL registers for one snapshot version."""
+
+    def __init__(self, snapshot, sales_rows: dict):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        rows = np.arange(snapshot.size, dtype=np.int64)
+        buckets, ranks = _buckets_and_ranks(rows)
+
+        self.values = {}
+        for key, column in SNAPSHOT_DIMENSIONS.items():
+            if column in snapshot.cat:
+                labels = snapshot.cat[column].categories
+                codes = snapshot.cat[column].codes.astype(np.int64)
+            else:
+                values = snapshot.num[column]
+                labels = [int(v) for v in np.unique(values[~np.isnan(values)])]
+                position = {v: i for i, v in enumerate(labels)}
+                codes = np.array(
+                    [-1 if v != v else position[int(v)] for v in values.tolist()], dtype=np.int64
+                )
+            registers = _grouped_registers(codes, buckets, ranks, len(labels))
+            self.values[key] = dict(zip(labels, registers))
+
+        for key in SALES_DIMENSIONS:
+            labels = sorted(sales_rows[key])
+            codes = np.concatenate(
+                [np.full(len(sales_rows[key][v]), i, dtype=np.int64) for i, v in enumerate(labels)]
+            ) if labels else np.zeros(0, dtype=np.int64)
+            member_rows = np.concatenate(
+                [np.asarray(sales_rows[key][v], dtype=np.int64) for v in labels]
+            ) if labels else np.zeros(0, dtype=np.int64)
+            registers = _grouped_registers(codes, buckets[member_rows], ranks[member_rows], len(labels))
+            self.values[key] = dict(zip(labels, registers))
+
+    @classmethod
+    def build(cls, snapshot) -> "AudienceSketches":
+        sales_rows = {key: {} for key in SALES_DIMENSIONS}
+        row_of_mobile = snapshot.row_of_mobile
+        for _, chunk in stream_chunks(_SALES_VALUES_SQL):
+            for mobile, brand, section in chunk:
+                row = row_of_mobile.get(mobile)
+                if row is None:
+                    continue
+                if brand is not None:
+                    sales_rows["brand"].setdefault(brand, set()).add(row)
+                if section is not None:
+                    sales_rows["section"].setdefault(section, set()).add(row)
+        sales_rows = {k: {v: sorted(rows) for v, rows in d.items()} for k, d in sales_rows.items()}
+        return cls(snapshot, sales_rows)
+
+    def estimate(self, filters: dict) -> dict | None:
+        """Approximate shortlist for run-count filters, or None if a filter isn't sketched.
+
+        Returns ``{"shortlisted_customers", "standard_error"}``.
+        """
+        active = {k: v for k, v in filters.items() if v is not None and v != "" and v != []}
+        if any(key not in SKETCHED_KEYS for key in active):
+            return None
+        if not active:
+            return {"shortlisted_customers": self.snapshot.size, "standard_error": 0.0}
+
+        groups = []
+        for key, wanted in active.items():
+            wanted = [wanted] if isinstance(wanted, (str, int)) else wanted
+            registers = [self.values[key][v] for v in wanted if v in self.values[key]]
+            if not registers:
+                return {"shortlisted_customers": 0, "standard_error": 0.0}
+            union = registers[0]
+            for more in registers[1:]:
+                union = np.maximum(union, more)
+            groups.append(union)
+
+        # |A ∩ B ∩ …| = Σ over non-empty subsets S of (-1)^(|S|+1) |∪ S|;
+        # each subset's union extends the union of the subset without its lowest member
+        unions = {}
+        total, variance, smallest = 0.0, 0.0, math.inf
+        for mask in range(1, 1 << len(groups)):
+            lowest = (mask & -mask).bit_length() - 1
+            rest = mask & (mask - 1)
+            union = groups[lowest] if not rest else np.maximum(unions[rest], groups[lowest])
+            unions[mask] = union
+            estimate = hll_estimate(union)
+            if not rest:
+                smallest = min(smallest, estimate)
+            total += estimate if bin(mask).count("1") % 2 else -estimate
+            variance += (HLL_RELATIVE_ERROR * estimate) ** 2
+        return {
+            "shortlisted_customers": int(round(min(max(total, 0.0), smallest))),
+            "standard_error": math.sqrt(variance),
+        }
+
+
+def _build(snapshot):
+    started = time.monotonic()
+    try:
+        sketches = AudienceSketches.build(snapshot)
+    except Exception as exc:
+        print(f"Audience HLL sketch build failed: {exc}")
+        sketches = None
+    with _lock:
+        _holder["building"] = None
+        if sketches is None:
+            _holder["failed"] = snapshot  # don't retry until the next snapshot
+            return
+        _holder["sketches"] = sketches
+    count = sum(len(values) for values in sketches.values.values())
+    print(
+        f"Audience HLL sketches built: {count} values, version {sketches.version}, "
+        f"{time.monotonic() - started:.1f}s"
+    )
+
+
+def get_audience_sketches(db=None, version: str | None = None) -> AudienceSketches | None:
+    """Sketches matching the current (or ``version``'s) snapshot; starts a background build and returns None if stale."""
+    if np is None:
+        return None
+    snapshot = get_snapshot(db, version)
+    if snapshot is None:
+        return None
+    with _lock:
+        sketches = _holder["sketches"]
+        if sketches is not None and sketches.snapshot is snapshot:
+            return sketches
+        if _holder["building"] is not snapshot and _holder["failed"] is not snapshot:
+            _holder["building"] = snapshot
+            threading.Thread(
+                target=_build, args=(snapshot,), name="audience-sketch-builder", daemon=True
+            ).start()
+    return None
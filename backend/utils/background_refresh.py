@@ -0,0 +1,57 @@
+"""Run data-reload refreshes off the request path.
+
+``get_data_version`` notifies its reload listeners on whichever request first
+sees a new watermark (and at startup in every worker).  Listeners that rebuild
+tables hand the work to a :class:`BackgroundRefresh` instead: it runs on a
+daemon thread, one run at a time per process, and a version that arrives
+while a run is in progress is queued (latest wins) and refreshed right after.
+Optionally it also re-runs every ``every_seconds`` with the last version, for
+changes that do not move the watermark (deleted rows).
+"""
+import threading
+import time
+
+
+class BackgroundRefresh:
+    """Single-runner background executor for ``refresh(version)``."""
+
+    def __init__(self, name: str, refresh, every_seconds: float | None = None):
+        self.name = name
+        self.refresh = refresh
+        self.every_seconds = every_seconds
+        self.last_version = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._pending = None
+        self._has_pending = False
+        self._ticker = None
+
+    def request(self, version):
+        """Refresh for ``version`` soon; returns immediately."""
+        with self._lock:
+            self.last_version = version
+            if self._running:
+                self._pending, self._has_pending = version, True
+                return
+            self._running = True
+            if self.every_seconds and self._ticker is None:
+                self._ticker = threading.Thread(target=self._tick, name=f"{self.name}-ticker", daemon=True)
+                self._ticker.start()
+        threading.Thread(target=self._run, args=(version,), name=self.name, daemon=True).start()
+
+    def _run(self, version):
+        while True:
+            try:
+                self.refresh(version)
+            except Exception as e:
+                print(f"{self.name} failed: {e}")
+            with self._lock:
+                if not self._has_pending:
+                    self._running = False
+                    return
+                version, self._pending, self._has_pending = self._pending, None, False
+
+    def _tick(self):
+        while True:
+            time.sleep(self.every_seconds)
+            self.request(self.last_version)
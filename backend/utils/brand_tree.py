@@ -0,0 +1,79 @@
+"""In-memory prefix tree of the campaign brand hierarchy.
+
+``campaign_brand_filter`` rows (brand → section → product → model → item) are
+folded into nested dicts.  :meth:`BrandTree.cascade` then answers "which
+values are valid at each level for the current selection" by walking only the
+selected branches, so the Create Campaign form no longer needs the full
+hierarchy client side.
+
+The table has no update timestamp, so the tree is rebuilt when its row count
+or highest id changes (rows added or deleted) and on every CRM data reload;
+an in-place edit of existing rows shows up with the next reload.
+"""
+import threading
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.campaign.brand_filter_model import CampaignBrandFilter
+from utils.data_version import get_data_version, on_data_reload
+
+BRAND_LEVELS = ("brand", "section", "product", "model", "item")
+
+_tree = {"version": None, "tree": None}
+_lock = threading.RLock()
+
+
+@on_data_reload
+def _clear(version):
+    with _lock:
+        _tree["version"] = _tree["tree"] = None
+
+
+class BrandTree:
+    """Nested ``{value: children}`` dicts, one level per BRAND_LEVELS entry.
+
+    A NULL level is kept as a ``None`` key: it is never offered as a value,
+    but the levels below it still are while nothing is selected there.
+    """
+
+    def __init__(self, rows):
+        self.root: dict = {}
+        for row in rows:
+            node = self.root
+            for value in row:
+                node = node.setdefault(value, {})
+
+    def cascade(self, selected: dict) -> dict:
+        """Valid values per level given ``selected`` {level: [values]} at the levels above.
+
+        An empty selection at a level lets every branch through; a value shows
+        up at a level when one of its ancestors' paths matches every selection
+        above it.
+        """
+        result = {}
+        nodes = [self.root]
+        for level in BRAND_LEVELS:
+            wanted = set(selected.get(level) or ())
+            values = set()
+            children = []
+            for node in nodes:
+                for value, child in node.items():
+                    if value is not None:
+                        values.add(value)
+                    if not wanted or value in wanted:
+                        children.append(child)
+            result[level] = sorted(values)
+            nodes = children
+        return result
+
+
+def get_brand_tree(db: Session) -> BrandTree:
+    """Brand tree for the current campaign_brand_filter contents, built on first use."""
+    count, last_id = db.query(func.count(CampaignBrandFilter.id), func.max(CampaignBrandFilter.id)).one()
+    version = (get_data_version(db), count, last_id)
+    with _lock:
+        if _tree["tree"] is None or _tree["version"] != version:
+            rows = db.query(*[getattr(CampaignBrandFilter, level) for level in BRAND_LEVELS])
+            _tree["tree"], _tree["version"] = BrandTree(rows), version
+        return _tree["tree"]
@@ -0,0 +1,287 @@
+"""In-process columnar snapshot of ``crm_analysis``.
+
+The whole table is loaded once per data version into NumPy arrays (low
+cardinality text columns as categorical codes) so dashboard filters and
+campaign audience counts become vectorised boolean masks instead of MySQL
+scans.  The snapshot is optional: it is skipped when NumPy is missing or
+``CRM_SNAPSHOT_ENABLED=0``, and callers fall back to SQL whenever
+:func:`get_snapshot` returns ``None``.  While a new data version loads, the
+previous snapshot is not served: results cached under the new version must
+not be computed from the old data.
+"""
+import os
+import threading
+import time
+from datetime import date
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models.crm_analysis import CRMAnalysis as CRMAnalysisModel
+from utils.data_version import get_data_version, on_data_reload
+
+try:
+    import numpy as np
+except ImportError:  # the snapshot is an optional accelerator
+    np = None
+
+SNAPSHOT_ENABLED = os.getenv("CRM_SNAPSHOT_ENABLED", "1") == "1" and np is not None
+LOAD_CHUNK_SIZE = 50000
+
+# crm_analysis columns kept as categorical codes (-1 = NULL)
+CATEGORICAL_COLUMNS = [
+    "CUSTOMER_NAME",
+    "SEGMENT_MAP",
+    "LAST_IN_STORE_CODE",
+    "LAST_IN_STORE_NAME",
+    "LAST_IN_STORE_CITY",
+    "LAST_IN_STORE_STATE",
+]
+# numeric columns kept as floats so NULL becomes NaN (never matches, like SQL)
+NUMERIC_COLUMNS = ["R_SCORE", "F_SCORE", "M_SCORE", "DAYS", "F_VALUE", "M_VALUE"]
+DATE_COLUMNS = ["FIRST_IN_DATE", "LAST_IN_DATE", "DOB", "ANNIV_DT"]
+
+# campaign-count filters that need crm_sales and therefore cannot be answered here
+SALES_FILTER_KEYS = ("brand", "section", "product", "model", "item", "value_threshold")
+# audience breakdown dimensions → snapshot column (branch is the store code, as in counts)
+FACET_COLUMNS = {
+    "segment": "SEGMENT_MAP",
+    "branch": "LAST_IN_STORE_CODE",
+    "city": "LAST_IN_STORE_CITY",
+    "state": "LAST_IN_STORE_STATE",
+    "r_score": "R_SCORE",
+    "f_score": "F_SCORE",
+    "m_score": "M_SCORE",
+}
+
+_holder = {"snapshot": None}
+_loader_lock = threading.Lock()
+
+
+class Categorical:
+    """Dictionary-encoded text column."""
+
+    def __init__(self, values: list):
+        self.categories = sorted({v for v in values if v is not None})
+        self.index = {v: i for i, v in enumerate(self.categories)}
+        self.codes = np.fromiter(
+            (self.index.get(v, -1) for v in values), dtype=np.int32, count=len(values)
+        )
+
+    def isin(self, wanted) -> "np.ndarray":
+        codes = [self.index[v] for v in wanted if v in self.index]
+        return np.isin(self.codes, codes)
+
+    def equals(self, value) -> "np.ndarray":
+        return self.codes == self.index.get(value, -2)
+
+
+class CRMSnapshot:
+    """Immutable column arrays for one data version of crm_analysis."""
+
+    def __init__(self, version: str | None, columns: dict):
+        self.version = version
+        self.mobile = np.array(columns["CUST_MOBILENO"], dtype=object)
+        self.size = len(self.mobile)
+        self.row_of_mobile = {m: i for i, m in enumerate(columns["CUST_MOBILENO"])}
+        self.cat = {name: Categorical(columns[name]) for name in CATEGORICAL_COLUMNS}
+        self.num = {
+            name: np.array(
+                [np.nan if v is None else float(v) for v in columns[name]], dtype=np.float64
+            )
+            for name in NUMERIC_COLUMNS
+        }
+        self.dates = {
+            name: np.array(columns[name], dtype="datetime64[D]") for name in DATE_COLUMNS
+        }
+
+    @classmethod
+    def load(cls, db: Session, version: str | None) -> "CRMSnapshot":
+        names = ["CUST_MOBILENO", *CATEGORICAL_COLUMNS, *NUMERIC_COLUMNS, *DATE_COLUMNS]
+        columns = {name: [] for name in names}
+        query = db.query(*[getattr(CRMAnalysisModel, name) for name in names])
+        for row in query.yield_per(LOAD_CHUNK_SIZE):
+            for name, value in zip(names, row):
+                columns[name].append(value)
+        return cls(version, columns)
+
+    def distinct(self, name: str) -> list:
+        """Distinct non-NULL values of a snapshot column."""
+        if name == "CUST_MOBILENO":
+            return [m for m in self.row_of_mobile if m is not None]
+        if name in self.cat:
+            return list(self.cat[name].categories)
+        values = self.num[name]
+        return [int(v) for v in np.unique(values[~np.isnan(values)])]
+
+    # --- Dashboard ---
+    def dashboard_mask(
+        self,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        phone: str | None = None,
+        name: str | None = None,
+        r_score: int | None = None,
+        f_score: int | None = None,
+        m_score: int | None = None,
+    ) -> "np.ndarray":
+        """Boolean mask equivalent to controllers.dashboard_filters.apply_dashboard_filters."""
+        mask = np.ones(self.size, dtype=bool)
+        if start_date:
+            mask &= self.dates["FIRST_IN_DATE"] >= np.datetime64(start_date, "D")
+        if end_date:
+            mask &= self.dates["FIRST_IN_DATE"] <= np.datetime64(end_date, "D")
+        if phone:
+            row = self.row_of_mobile.get(phone)
+            only = np.zeros(self.size, dtype=bool)
+            if row is not None:
+                only[row] = True
+            mask &= only
+        if name:
+            mask &= self.cat["CUSTOMER_NAME"].equals(name)
+        if r_score is not None:
+            mask &= self.num["R_SCORE"] == r_score
+        if f_score is not None:
+            mask &= self.num["F_SCORE"] == f_score
+        if m_score is not None:
+            mask &= self.num["M_SCORE"] == m_score
+        return mask
+
+    def segment_counts(self, mask) -> dict:
+        """Customer count per segment label (NULL/empty → "Unknown")."""
+        seg = self.cat["SEGMENT_MAP"]
+        counts = np.bincount(seg.codes[mask] + 1, minlength=len(seg.categories) + 1)
+        result: dict = {}
+        for code, count in enumerate(counts.tolist()):
+            if not count:
+                continue
+            label = (seg.categories[code - 1] if code else None) or "Unknown"
+            result[label] = result.get(label, 0) + count
+        return result
+
+    def days_bucket_counts(self, mask, upper_bounds: list) -> list:
+        """Counts per DAYS bucket; bucket i holds DAYS <= upper_bounds[i], the last one the rest."""
+        days = np.nan_to_num(self.num["DAYS"][mask], nan=0.0)
+        buckets = np.searchsorted(np.asarray(upper_bounds, dtype=np.float64), days, side="left")
+        return np.bincount(buckets, minlength=len(upper_bounds) + 1).tolist()
+
+    def fiscal_year_pairs(self, mask, start_month: int) -> dict:
+        """{(first FY, last FY or None): customers} for masked rows with a FIRST_IN_DATE."""
+        first = self.dates["FIRST_IN_DATE"][mask]
+        last = self.dates["LAST_IN_DATE"][mask]
+        keep = ~np.isnat(first)
+        first, last = first[keep], last[keep]
+        if not first.size:
+            return {}
+        first_fy = _fiscal_years(first, start_month)
+        last_fy = np.where(np.isnat(last), -1, _fiscal_years(last, start_month))
+        pairs, counts = np.unique(np.stack([first_fy, last_fy]), axis=1, return_counts=True)
+        return {
+            (int(f), int(l) if l >= 0 else None): int(c)
+            for (f, l), c in zip(pairs.T.tolist(), counts.tolist())
+        }
+
+    # --- Campaign audience ---
+    def audience_mask(self, filters: dict):
+        """Mask for get_campaign_run_count_from_request filters, or None if SQL is needed."""
+        if any(filters.get(key) not in (None, [], "") for key in SALES_FILTER_KEYS):
+            return None
+
+        mask = np.ones(self.size, dtype=bool)
+        for key, column in (
+            ("branch", "LAST_IN_STORE_CODE"),
+            ("city", "LAST_IN_STORE_CITY"),
+            ("state", "LAST_IN_STORE_STATE"),
+        ):
+            if filters.get(key):
+                mask &= self.cat[column].isin(filters[key])
+
+        for prefix, column in (("recency", "DAYS"), ("frequency", "F_VALUE"), ("monetary", "M_VALUE")):
+            op = filters.get(f"{prefix}_op")
+            value = filters.get(f"{prefix}_min")
+            if op and value is not None:
+                values = self.num[column]
+                if op == ">=":
+                    mask &= values >= value
+                elif op == "<=":
+                    mask &= values <= value
+                elif op == "=":
+                    mask &= values == value
+
+        for key, column in (("r_score", "R_SCORE"), ("f_score", "F_SCORE"), ("m_score", "M_SCORE")):
+            if filters.get(key):
+                mask &= np.isin(self.num[column], filters[key])
+
+        for prefix, column in (("birthday", "DOB"), ("anniversary", "ANNIV_DT")):
+            start, end = filters.get(f"{prefix}_start"), filters.get(f"{prefix}_end")
+            if start and end:
+                try:
+                    lo, hi = np.datetime64(start, "D"), np.datetime64(end, "D")
+                except ValueError:
+                    return None  # let MySQL interpret unusual date strings
+                mask &= (self.dates[column] >= lo) & (self.dates[column] <= hi)
+        return mask
+
+    def facet_counts(self, rows) -> dict:
+        """{facet: {value: customers}} over ``rows`` (a mask or row ids), NULLs skipped."""
+        result = {}
+        for key, column in FACET_COLUMNS.items():
+            if column in self.cat:
+                cat = self.cat[column]
+                counts = np.bincount(cat.codes[rows] + 1, minlength=len(cat.categories) + 1)
+                result[key] = {
+                    cat.categories[code - 1]: count
+                    for code, count in enumerate(counts.tolist()) if code and count
+                }
+            else:
+                values = self.num[column][rows]
+                values, counts = np.unique(values[~np.isnan(values)], return_counts=True)
+                result[key] = {int(v): c for v, c in zip(values.tolist(), counts.tolist())}
+        return result
+
+
+def _fiscal_years(dates, start_month: int):
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    return years - (months < start_month)
+
+
+def _load(version: str | None):
+    with _loader_lock:
+        current = _holder["snapshot"]
+        if current is not None and current.version == version:
+            return
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            snapshot = CRMSnapshot.load(db, version)
+        finally:
+            db.close()
+        _holder["snapshot"] = snapshot
+        print(
+            f"crm_analysis snapshot loaded: {snapshot.size} rows, version {version}, "
+            f"{time.monotonic() - started:.1f}s"
+        )
+
+
+@on_data_reload
+def _reload_on_data_change(version):
+    if not SNAPSHOT_ENABLED:
+        return
+    # until the new one loads get_snapshot returns None and callers use SQL
+    threading.Thread(target=_load, args=(version,), name="crm-snapshot-loader", daemon=True).start()
+
+
+def get_snapshot(db: Session | None = None, version: str | None = None) -> CRMSnapshot | None:
+    """Snapshot of the current data version, or None when disabled / not loaded yet.
+
+    Callers that key a cache by a version they read earlier pass it as
+    ``version`` so the snapshot they get is exactly that version's data.
+    """
+    if not SNAPSHOT_ENABLED:
+        return None
+    current = get_data_version(db)  # notices new data loads and triggers a reload
+    snapshot = _holder["snapshot"]
+    if snapshot is None or snapshot.version != (current if version is None else version):
+        return None  # the new version is still loading: callers use SQL
+    return snapshot
@@ -0,0 +1,73 @@
+"""CRM data-load watermark shared by the dashboard/campaign caches.
+
+``crm_analysis`` is reloaded in batches and every loaded row carries
+``DATA_UPDATED_TIME``, so ``MAX(DATA_UPDATED_TIME)`` identifies the data that
+is currently being served.  Anything derived from it (pre-aggregates, in-memory
+snapshots, response caches) registers with :func:`on_data_reload` and is
+rebuilt / dropped when the watermark moves.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import func
+
+from database import SessionLocal
+from models.crm_analysis import CRMAnalysis as CRMAnalysisModel
+
+# How often (seconds) a request is allowed to re-read MAX(DATA_UPDATED_TIME).
+CHECK_INTERVAL_SECONDS = float(os.getenv("DATA_VERSION_CHECK_SECONDS", "30"))
+
+_lock = threading.Lock()
+_state = {"version": None, "checked_at": None}
+_listeners = []
+
+
+def on_data_reload(callback):
+    """Register ``callback(version)`` to run whenever the watermark advances."""
+    _listeners.append(callback)
+    return callback
+
+
+def _read_version(db) -> str | None:
+    latest = db.query(func.max(CRMAnalysisModel.DATA_UPDATED_TIME)).scalar()
+    if latest is None:
+        return None
+    return latest.isoformat() if hasattr(latest, "isoformat") else str(latest)
+
+
+def get_data_version(db=None, force: bool = False) -> str | None:
+    """Return the current data version, re-reading it at most every CHECK_INTERVAL_SECONDS.
+
+    The first call, and every call that observes a new watermark, notifies the
+    registered reload listeners before returning.
+    """
+    now = time.monotonic()
+    checked_at = _state["checked_at"]
+    if not force and checked_at is not None and now - checked_at < CHECK_INTERVAL_SECONDS:
+        return _state["version"]
+
+    if db is None:
+        session = SessionLocal()
+        try:
+            version = _read_version(session)
+        finally:
+            session.close()
+    else:
+        version = _read_version(db)
+
+    with _lock:
+        # compare against the shared state, not our earlier read, so only one
+        # of several concurrent callers sees the change
+        changed = _state["checked_at"] is None or version != _state["version"]
+        _state["version"] = version
+        _state["checked_at"] = now
+
+    if changed:
+        print(f"CRM data version → {version}")
+        for callback in list(_listeners):
+            try:
+                callback(version)
+            except Exception as e:
+                print(f"Data reload listener {callback.__name__} failed: {e}")
+    return version
@@ -0,0 +1,131 @@
+"""Server-side cursor streaming for large exports.
+
+Rows are read on a dedicated connection with ``stream_results`` (an unbuffered
+pymysql cursor), so only one chunk is ever held in Python.  The connection is
+returned to the pool when the stream finishes or is closed – Starlette closes
+it when the client disconnects from a StreamingResponse.  Closing an
+unbuffered cursor early would make pymysql read the rest of the result, so a
+stream closed before its end first issues ``KILL QUERY`` for its connection.
+
+A download budget cannot be a MAX_EXECUTION_TIME hint here: the statement
+keeps running while the client reads, so a long but healthy export would be
+cut off.  :meth:`RowStream.start` instead bounds the time to the first chunk
+with a watchdog that kills the query.
+"""
+import os
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from database import engine
+from utils.query_budget import ER_QUERY_INTERRUPTED, QueryCancelled, QueryTimeout, connection_id, kill_query
+
+STREAM_CHUNK_SIZE = 5000
+# seconds MySQL waits for a slow HTTP client before dropping a streaming connection
+STREAM_NET_WRITE_TIMEOUT = int(os.getenv("STREAM_NET_WRITE_TIMEOUT", "600"))
+
+
+class RowStream:
+    """One statement's rows in chunks, read with an unbuffered cursor on its own connection.
+
+    ``connect()`` → ``start()`` → iterate ``chunks()``; ``close()`` is safe at
+    any point and is called when ``chunks()`` ends or is closed.
+    """
+
+    def __init__(self, statement, params: dict | None = None, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.statement = statement
+        self.params = params or {}
+        self.chunk_size = chunk_size
+        self.conn = None
+        self.connection_id = None
+        self.keys = []
+        self._result = None
+        self._partitions = None
+        self._first = None
+        self._exhausted = False
+        self._closed = False
+        self._timed_out = False
+
+    def connect(self):
+        self.conn = engine.connect()
+        self.connection_id = connection_id(self.conn)
+        if self.connection_id is not None:
+            self.conn.execute(text(f"SET SESSION net_write_timeout = {int(STREAM_NET_WRITE_TIMEOUT)}"))
+        return self
+
+    def start(self, budget_ms: int | None = None):
+        """Run the statement and fetch the first chunk; QueryTimeout if that takes over ``budget_ms``."""
+        if self.conn is None:
+            self.connect()
+        watchdog = None
+        if budget_ms is not None and self.connection_id is not None:
+            watchdog = threading.Timer(budget_ms / 1000, self._budget_exceeded)
+            watchdog.start()
+        try:
+            self._result = self.conn.execution_options(
+                stream_results=True, yield_per=self.chunk_size
+            ).execute(self.statement, self.params)
+            self.keys = list(self._result.keys())
+            self._partitions = self._result.partitions(self.chunk_size)
+            self._first = next(self._partitions, None)
+        except Exception as exc:
+            self._exhausted = True  # the statement is no longer running
+            self.close()
+            orig = getattr(exc, "orig", None)
+            if isinstance(exc, OperationalError) and orig is not None and orig.args and orig.args[0] == ER_QUERY_INTERRUPTED:
+                raise (QueryTimeout if self._timed_out else QueryCancelled)(str(orig)) from exc
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+        if self._first is None:
+            self._exhausted = True
+        return self
+
+    def _budget_exceeded(self):
+        self._timed_out = True
+        kill_query(self.connection_id, "stream budget exceeded")
+
+    def chunks(self):
+        """Yield lists of rows; the connection is released when this generator ends or is closed."""
+        try:
+            if self._result is None:
+                self.start()
+            if self._first is not None:
+                first, self._first = self._first, None
+                yield first
+                for rows in self._partitions:
+                    yield rows
+            self._exhausted = True
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if not self._exhausted and self.connection_id is not None:
+            # otherwise closing the cursor reads every remaining row first
+            try:
+                kill_query(self.connection_id, "stream closed early")
+            except Exception as exc:
+                print(f"Could not stop streaming query on connection {self.connection_id}: {exc}")
+        try:
+            if self._result is not None:
+                self._result.close()
+        except Exception:
+            self.conn.invalidate()
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+
+
+def stream_chunks(statement, params: dict | None = None, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yield ``(column_names, rows)`` chunks of at most ``chunk_size`` rows."""
+    stream = RowStream(statement, params, chunk_size).connect().start()
+    try:
+        for rows in stream.chunks():
+            yield stream.keys, rows
+    finally:
+        stream.close()
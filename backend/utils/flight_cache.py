@@ -0,0 +1,96 @@
+"""Bounded LRU cache with single-flight coalescing.
+
+Concurrent callers asking for the same key while it is being computed wait
+for the one computation instead of each running their own query.  Entries
+are dropped on every data reload, and a result is only stored when the data
+version it was computed for is still current afterwards.  A computation
+cancelled for its own caller (client gone, superseded live count) is not
+passed on: the waiting callers start the key again instead.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from utils.data_version import get_data_version, on_data_reload
+from utils.query_budget import QueryCancelled
+
+
+def canonical_key(payload: dict) -> str:
+    """Stable hash of a filter payload: empties dropped, lists sorted and de-duplicated."""
+    normalised = {}
+    for key, value in payload.items():
+        if value is None or value == "" or value == []:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(set(value), key=str)
+        normalised[key] = value
+    raw = json.dumps(normalised, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlightCache:
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._flights: dict = {}
+        self._lock = threading.Lock()
+        on_data_reload(self._clear)
+
+    def _clear(self, version=None):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_compute(self, key, compute, version: str | None = None):
+        """Cached value for ``key``, running ``compute()`` at most once per key at a time.
+
+        With ``version`` the result is shared with waiting callers but only
+        stored if that data version is still current when it is ready.
+        """
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+            if leader:
+                break
+            flight.done.wait()
+            if isinstance(flight.error, QueryCancelled):
+                continue  # the leader's caller went away, not ours
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            # read the version outside the lock: a change runs the reload
+            # listeners, _clear among them
+            current = version
+            if version is not None and flight.error is None:
+                try:
+                    current = get_data_version()
+                except Exception:
+                    current = None
+            with self._lock:
+                self._flights.pop(key, None)
+                if flight.error is None and current == version:
+                    self._entries[key] = flight.result
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            flight.done.set()
+        return flight.result
@@ -0,0 +1,93 @@
+"""Time budgets and client-disconnect cancellation for heavy audience queries.
+
+The budget is enforced by MySQL itself: budgeted SELECTs carry a
+``MAX_EXECUTION_TIME`` optimizer hint, so a runaway statement is stopped
+server-side and its pooled connection is released instead of being held for
+minutes.  :func:`run_cancellable` additionally watches the HTTP request and
+issues ``KILL QUERY`` for the session's connection once the client has gone.
+A budget overrun surfaces as :class:`QueryTimeout`, a kill as
+:class:`QueryCancelled`.  On other databases the hint is not emitted and
+nothing is killed.
+"""
+import asyncio
+import os
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from starlette.concurrency import run_in_threadpool
+
+import database
+
+# per-endpoint budgets (milliseconds)
+COUNT_BUDGET_MS = int(os.getenv("AUDIENCE_COUNT_BUDGET_MS", "8000"))
+DOWNLOAD_BUDGET_MS = int(os.getenv("AUDIENCE_DOWNLOAD_BUDGET_MS", "60000"))
+ESTIMATE_BUDGET_MS = int(os.getenv("AUDIENCE_ESTIMATE_BUDGET_MS", "3000"))
+# how often (seconds) a running request checks whether its client is still there
+DISCONNECT_POLL_SECONDS = 0.5
+
+ER_QUERY_TIMEOUT = 3024  # maximum statement execution time exceeded
+ER_QUERY_INTERRUPTED = 1317  # KILL QUERY
+
+
+class QueryTimeout(Exception):
+    """A budgeted query ran out of time on the server."""
+
+
+class QueryCancelled(QueryTimeout):
+    """A query was killed because its client disconnected."""
+
+
+def with_time_budget(statement, budget_ms: int):
+    """``statement`` with a MySQL MAX_EXECUTION_TIME hint (SELECT only)."""
+    return statement.prefix_with(f"/*+ MAX_EXECUTION_TIME({int(budget_ms)}) */", dialect="mysql")
+
+
+def execute_budgeted(db, statement, params: dict | None = None, budget_ms: int = COUNT_BUDGET_MS):
+    """Execute a SELECT under ``budget_ms``; QueryTimeout/QueryCancelled when it is stopped."""
+    try:
+        return db.execute(with_time_budget(statement, budget_ms), params or {})
+    except OperationalError as exc:
+        code = exc.orig.args[0] if exc.orig is not None and exc.orig.args else None
+        if code == ER_QUERY_TIMEOUT:
+            db.rollback()
+            raise QueryTimeout(str(exc.orig)) from exc
+        if code == ER_QUERY_INTERRUPTED:
+            db.rollback()
+            raise QueryCancelled(str(exc.orig)) from exc
+        raise
+
+
+def connection_id(db) -> int | None:
+    """MySQL connection id of a session's (or Connection's) connection; None on other databases."""
+    dialect = db.dialect if hasattr(db, "dialect") else db.get_bind().dialect
+    if dialect.name != "mysql":
+        return None
+    return db.execute(text("SELECT CONNECTION_ID()")).scalar()
+
+
+def kill_query(connection_id: int, reason: str = "client disconnected"):
+    """Stop whatever statement MySQL connection ``connection_id`` is running."""
+    with database.engine.connect() as conn:
+        conn.execute(text(f"KILL QUERY {int(connection_id)}"))
+    print(f"Killed query on connection {connection_id}: {reason}")
+
+
+async def run_cancellable(request: Request, db, work):
+    """Run ``work()`` in the threadpool; kill its query if the client disconnects.
+
+    Returns work's result.  Raises QueryCancelled when the client went away.
+    """
+    conn_id = await run_in_threadpool(connection_id, db)
+    task = asyncio.ensure_future(run_in_threadpool(work))
+    killed = False
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            break
+        if not killed and conn_id is not None and await request.is_disconnected():
+            killed = True
+            await run_in_threadpool(kill_query, conn_id)
+    if killed and task.exception() is None:
+        raise QueryCancelled("client disconnected")
+    return task.result()
@@ -0,0 +1,95 @@
+"""Conditional-GET cache for read-only endpoints whose payload only changes on a data load.
+
+The ETag is a hash of the request path, the normalised query string and the
+CRM data version (``MAX(DATA_UPDATED_TIME)``), so it can be checked before any
+query runs: a matching ``If-None-Match`` gets a bare 304, and otherwise the
+serialised JSON bytes are served from a bounded in-process LRU.  A body is
+only cached when the data version is still the one in its ETag after it was
+built, so an entry always holds data of the version it is keyed by.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from utils.data_version import get_data_version, on_data_reload
+
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "256"))
+MAX_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(128 * 1024 * 1024)))
+# bodies above this are still ETag-validated but not kept in memory
+MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_ENTRY_BYTES", str(16 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_entries: OrderedDict = OrderedDict()
+_size = {"bytes": 0}
+
+
+@on_data_reload
+def _clear(version):
+    with _lock:
+        _entries.clear()
+        _size["bytes"] = 0
+
+
+def _etag(request: Request, version: str | None) -> str:
+    params = sorted((k, v) for k, v in request.query_params.multi_items() if v != "")
+    raw = json.dumps([request.url.path, params, version], default=str)
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [t.strip() for t in header.split(",")]
+
+
+def _get(etag: str) -> tuple[bytes, dict] | None:
+    with _lock:
+        entry = _entries.get(etag)
+        if entry is not None:
+            _entries.move_to_end(etag)
+        return entry
+
+
+def _put(etag: str, body: bytes, extra_headers: dict):
+    if len(body) > MAX_ENTRY_BYTES:
+        return
+    with _lock:
+        if etag in _entries:
+            return
+        _entries[etag] = (body, extra_headers)
+        _size["bytes"] += len(body)
+        while _entries and (len(_entries) > MAX_ENTRIES or _size["bytes"] > MAX_BYTES):
+            _, (evicted, _) = _entries.popitem(last=False)
+            _size["bytes"] -= len(evicted)
+
+
+def cached_json_response(request: Request, db, build, with_headers: bool = False) -> Response:
+    """Serve ``build()`` as JSON with ETag / 304 handling and LRU-cached bytes.
+
+    ``build`` is only called on a cache miss and must return something
+    ``jsonable_encoder`` understands (dicts, lists, Pydantic models).  With
+    ``with_headers`` it returns ``(payload, headers)`` instead, and the extra
+    headers are cached and sent along with the body.
+    """
+    version = get_data_version(db)
+    etag = _etag(request, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    entry = _get(etag)
+    if entry is None:
+        payload, extra_headers = build() if with_headers else (build(), {})
+        body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+        if get_data_version(db) == version:
+            _put(etag, body, extra_headers)  # otherwise build() may have read the newer data
+    else:
+        body, extra_headers = entry
+    return Response(content=body, media_type="application/json", headers={**headers, **extra_headers})
@@ -0,0 +1,62 @@
+"""Prefix search over high-cardinality crm_analysis columns (phone, name).
+
+Each column's distinct values are kept in a case-folded sorted array and a
+prefix lookup is two ``bisect`` calls, so typeahead requests never touch
+MySQL.  An index is built lazily on first use per data version and dropped
+when a new data load is detected.
+"""
+import threading
+from bisect import bisect_left
+
+from sqlalchemy.orm import Session
+
+from utils.crm_snapshot import get_snapshot
+from utils.data_version import get_data_version, on_data_reload
+
+_indexes: dict = {}
+_lock = threading.RLock()
+
+
+@on_data_reload
+def _clear(version):
+    with _lock:
+        _indexes.clear()
+
+
+class PrefixIndex:
+    """Sorted (case-folded key, value) pairs for one column."""
+
+    def __init__(self, values):
+        pairs = sorted((str(v).casefold(), v) for v in values if v not in (None, ""))
+        self.keys = [k for k, _ in pairs]
+        self.values = [v for _, v in pairs]
+
+    def search(self, prefix: str, limit: int) -> list:
+        prefix = prefix.casefold()
+        start = bisect_left(self.keys, prefix)
+        matches = []
+        for i in range(start, min(start + limit, len(self.keys))):
+            if not self.keys[i].startswith(prefix):
+                break
+            matches.append(self.values[i])
+        return matches
+
+
+def _load_values(db: Session, column, version: str | None) -> list:
+    snapshot = get_snapshot(db, version)
+    if snapshot is not None:
+        return snapshot.distinct(column.key)
+    return [v for (v,) in db.query(column).filter(column.isnot(None)).distinct()]
+
+
+def prefix_search(db: Session, column, prefix: str, limit: int) -> list:
+    """Up to ``limit`` distinct values of ``column`` starting with ``prefix`` (case-insensitive)."""
+    version = get_data_version(db)
+    key = (column.key, version)
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            # built under the lock so concurrent first requests share one load
+            index = PrefixIndex(_load_values(db, column, version))
+            _indexes[key] = index
+    return index.search(prefix, limit)
@@ -0,0 +1,182 @@
+"""Constant-memory XLSX export, streamed as it is written.
+
+:func:`stream_xlsx` turns chunks of rows (e.g. from
+:func:`utils.db_stream.stream_chunks`) into the bytes of an .xlsx file and
+yields them as each chunk is compressed, so a StreamingResponse starts
+sending at once and memory stays at one chunk plus the deflate window.
+
+The package is written with ``zipfile`` onto an unseekable sink (members
+carry data descriptors), strings are stored inline rather than in a shared
+strings table, and the workbook parts that list the sheets are written after
+the sheets themselves.  A sheet holds at most XLSX_MAX_ROWS rows including
+its header; further rows roll over to "<name> (2)", "<name> (3)", …
+"""
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLSX_MAX_ROWS = 1_048_576
+
+# characters XML 1.0 does not allow, even escaped
+_ILLEGAL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = "</sheetData></worksheet>"
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    "{sheets}</Types>"
+)
+_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{n}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    "<sheets>{sheets}</sheets></workbook>"
+)
+_WORKBOOK_SHEET = '<sheet name="{name}" sheetId="{n}" r:id="rId{n}"/>'
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    "{sheets}</Relationships>"
+)
+_WORKBOOK_REL = (
+    '<Relationship Id="rId{n}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet{n}.xml"/>'
+)
+
+
+class _Sink:
+    """Write-only file object whose contents are drained after every chunk."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _column_letters(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _cell(ref: str, value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    text = escape(_ILLEGAL_XML.sub("", str(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _sheet_name(base: str, n: int) -> str:
+    # Excel sheet names: at most 31 characters, none of []:*?/\
+    base = re.sub(r"[\[\]:*?/\\]", "_", base)
+    suffix = f" ({n})" if n > 1 else ""
+    return escape(base[: 31 - len(suffix)] + suffix, {'"': "&quot;"})
+
+
+def stream_xlsx(columns, chunks, sheet_name: str = "Sheet1", max_rows: int = XLSX_MAX_ROWS):
+    """Yield the bytes of an .xlsx with a ``columns`` header and the rows of ``chunks``.
+
+    ``chunks`` is an iterable of row sequences; each row is a sequence of
+    values in column order.  Every sheet repeats the header row.
+    """
+    refs = [_column_letters(i) for i in range(len(columns))]
+    header = "".join(_cell(f"{ref}1", name) for ref, name in zip(refs, columns))
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+    sheets = 0
+    member = None
+    row_number = max_rows  # forces the first sheet to open
+
+    def open_sheet():
+        nonlocal sheets, member, row_number
+        if member is not None:
+            member.write(_SHEET_END.encode())
+            member.close()
+        sheets += 1
+        member = archive.open(f"xl/worksheets/sheet{sheets}.xml", "w")
+        member.write((_SHEET_START + f'<row r="1">{header}</row>').encode())
+        row_number = 1
+
+    for rows in chunks:
+        parts = []
+        for row in rows:
+            if row_number >= max_rows:
+                if parts:
+                    member.write("".join(parts).encode())
+                    parts = []
+                open_sheet()
+            row_number += 1
+            cells = "".join(_cell(f"{ref}{row_number}", value) for ref, value in zip(refs, row))
+            parts.append(f'<row r="{row_number}">{cells}</row>')
+        if parts:
+            member.write("".join(parts).encode())
+        data = sink.drain()
+        if data:
+            yield data
+
+    if member is None:
+        open_sheet()  # header-only workbook
+    member.write(_SHEET_END.encode())
+    member.close()
+
+    numbers = range(1, sheets + 1)
+    archive.writestr(
+        "[Content_Types].xml",
+        _CONTENT_TYPES.format(sheets="".join(_SHEET_CONTENT_TYPE.format(n=n) for n in numbers)),
+    )
+    archive.writestr("_rels/.rels", _ROOT_RELS)
+    archive.writestr(
+        "xl/workbook.xml",
+        _WORKBOOK.format(sheets="".join(
+            _WORKBOOK_SHEET.format(name=_sheet_name(sheet_name, n), n=n) for n in numbers
+        )),
+    )
+    archive.writestr(
+        "xl/_rels/workbook.xml.rels",
+        _WORKBOOK_RELS.format(sheets="".join(_WORKBOOK_REL.format(n=n) for n in numbers)),
+    )
+    archive.close()
+    yield sink.drain()
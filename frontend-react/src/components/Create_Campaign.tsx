@@ -1,4 +1,4 @@
-import React, { useCallback, useEffect, useMemo, useState } from "react";
+import React, { useCallback, useEffect, useMemo, useRef, useState } from "react";
 import {
   message,
   Form,
@@ -29,12 +29,12 @@ const { Title, Text, Link } = Typography;
 const { RangePicker } = DatePicker;
 const { Option } = Select;
 
-type BrandHierarchyEntry = {
-  brand: string;
-  section: string;
-  product: string;
-  model: string;
-  item: string;
+type BrandCascade = {
+  brands: string[];
+  sections: string[];
+  products: string[];
+  models: string[];
+  items: string[];
 };
 
 
@@ -52,7 +52,6 @@ interface CampaignOptions {
   products: string[];
   models: string[];
   items: string[];
-  brand_hierarchy: BrandHierarchyEntry[];
 }
 type BasedOnOption = "Customer Base" | "upload";
 
@@ -108,6 +107,29 @@ interface FormValues {
   valueThreshold?: number;
 }
 
+interface LiveCount {
+  seq: number;
+  total_customers: number;
+  shortlisted_customers: number;
+  estimated?: boolean;
+}
+
+// request body for /campaign/run/count and the live count socket
+const buildCountPayload = (values: FormValues): Record<string, unknown> => {
+  const payload: Record<string, unknown> = {
+    ...values,
+    birthday_start: values.birthdayRange?.[0]?.format("YYYY-MM-DD"),
+    birthday_end: values.birthdayRange?.[1]?.format("YYYY-MM-DD"),
+    anniversary_start: values.anniversaryRange?.[0]?.format("YYYY-MM-DD"),
+    anniversary_end: values.anniversaryRange?.[1]?.format("YYYY-MM-DD"),
+  };
+  Object.keys(payload).forEach((key) => {
+    const v = payload[key];
+    if (v === undefined || v === null || (Array.isArray(v) && v.length === 0)) delete payload[key];
+  });
+  return payload;
+};
+
 interface MultiSelectDropdownProps {
   name: string;
   label: string;
@@ -138,7 +160,6 @@ const CreateCampaign: React.FC = () => {
     products: [],
     models: [],
     items: [],
-    brand_hierarchy: [],
   });
 
   const [optionsLoaded, setOptionsLoaded] = useState(false);
@@ -167,7 +188,6 @@ const CreateCampaign: React.FC = () => {
     f_scores,
     m_scores,
     rfm_segments,
-    brand_hierarchy,
   } = options;
 
   // ---------- helper functions ----------
@@ -257,33 +277,39 @@ const CreateCampaign: React.FC = () => {
     watchState,
   ]);
 
-  const computeBrandOptions = useCallback(() => {
-    let filtered = brand_hierarchy || [];
+  // valid values per brand level for the current selection, from the server-side cascade
+  const [brandCascade, setBrandCascade] = useState<BrandCascade | null>(null);
 
-    if (watchPurchaseBrand.length) {
-      filtered = filtered.filter((entry) => watchPurchaseBrand.includes(entry.brand));
-    }
-    if (watchSection.length) {
-      filtered = filtered.filter((entry) => watchSection.includes(entry.section));
-    }
-    if (watchProduct.length) {
-      filtered = filtered.filter((entry) => watchProduct.includes(entry.product));
-    }
-    if (watchModel.length) {
-      filtered = filtered.filter((entry) => watchModel.includes(entry.model));
-    }
-    if (watchItem.length) {
-      filtered = filtered.filter((entry) => watchItem.includes(entry.item));
-    }
-
-    const allowedBrands = Array.from(new Set(filtered.map((entry) => entry.brand)));
-    const allowedSections = Array.from(new Set(filtered.map((entry) => entry.section)));
-    const allowedProducts = Array.from(new Set(filtered.map((entry) => entry.product)));
-    const allowedModels = Array.from(new Set(filtered.map((entry) => entry.model)));
-    const allowedItems = Array.from(new Set(filtered.map((entry) => entry.item)));
+  useEffect(() => {
+    if (!optionsLoaded) return;
+    const params = new URLSearchParams();
+    watchPurchaseBrand.forEach((v) => params.append("brand", v));
+    watchSection.forEach((v) => params.append("section", v));
+    watchProduct.forEach((v) => params.append("product", v));
+    watchModel.forEach((v) => params.append("model", v));
+    axios
+      .get<BrandCascade>("/api/campaign/brand-cascade", { params })
+      .then((res) => setBrandCascade(res.data))
+      .catch(() => message.error("Failed to load brand filters"));
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [
+    optionsLoaded,
+    watchPurchaseBrand.join("\u0001"),
+    watchSection.join("\u0001"),
+    watchProduct.join("\u0001"),
+    watchModel.join("\u0001"),
+  ]);
 
-    return { allowedBrands, allowedSections, allowedProducts, allowedModels, allowedItems };
-  }, [brand_hierarchy, watchItem, watchModel, watchProduct, watchPurchaseBrand, watchSection]);
+  const computeBrandOptions = useCallback(
+    () => ({
+      allowedBrands: brandCascade?.brands ?? [],
+      allowedSections: brandCascade?.sections ?? [],
+      allowedProducts: brandCascade?.products ?? [],
+      allowedModels: brandCascade?.models ?? [],
+      allowedItems: brandCascade?.items ?? [],
+    }),
+    [brandCascade]
+  );
 
 
   useEffect(() => {
@@ -382,7 +408,7 @@ const CreateCampaign: React.FC = () => {
   ]);
 
   useEffect(() => {
-    if (!optionsLoaded || !brand_hierarchy?.length) return;
+    if (!optionsLoaded || !brandCascade) return;
     const { allowedBrands, allowedSections, allowedProducts, allowedModels, allowedItems } =
       computeBrandOptions();
     const pruned = {
@@ -403,7 +429,7 @@ const CreateCampaign: React.FC = () => {
       form.setFieldsValue(pruned);
     }
   }, [
-    brand_hierarchy,
+    brandCascade,
     computeBrandOptions,
     form,
     optionsLoaded,
@@ -528,19 +554,65 @@ const CreateCampaign: React.FC = () => {
     }
   };
 
+  // ---------- live audience count ----------
+  // One socket per form; filter deltas go up, the server debounces them and
+  // answers with the count for the latest seq it has seen.
+  const [liveCount, setLiveCount] = useState<LiveCount | null>(null);
+  const liveSocket = useRef<WebSocket | null>(null);
+  const liveSent = useRef<Record<string, string>>({});
+  const liveSeq = useRef(0);
+  // set when the server rejected a message and kept its previous filters
+  const liveResync = useRef(false);
+
+  useEffect(() => {
+    const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+    const ws = new WebSocket(`${scheme}://${window.location.host}/api/campaign/run/live`);
+    ws.onopen = () => {
+      liveSent.current = {};
+      liveResync.current = false;
+      pushLiveFilters(form.getFieldsValue());
+    };
+    ws.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.rejected) liveResync.current = true;
+      if (data.error) return;
+      setLiveCount((prev) => (prev && prev.seq > data.seq ? prev : data));
+    };
+    liveSocket.current = ws;
+    return () => ws.close();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, []);
+
+  const pushLiveFilters = (values: FormValues) => {
+    const ws = liveSocket.current;
+    if (!ws || ws.readyState !== WebSocket.OPEN) return;
+    const payload = buildCountPayload(values);
+    const next: Record<string, string> = {};
+    const set: Record<string, unknown> = {};
+    Object.entries(payload).forEach(([key, value]) => {
+      next[key] = JSON.stringify(value);
+      if (liveSent.current[key] !== next[key]) set[key] = value;
+    });
+    const unset = Object.keys(liveSent.current).filter((key) => !(key in next));
+    if (!Object.keys(set).length && !unset.length) return;
+    liveSent.current = next;
+    liveSeq.current += 1;
+    if (liveResync.current) {
+      // the server no longer has what liveSent says; replace its filters outright
+      liveResync.current = false;
+      ws.send(JSON.stringify({ seq: liveSeq.current, filters: payload }));
+      return;
+    }
+    ws.send(JSON.stringify({ seq: liveSeq.current, set, unset }));
+  };
+
   const handleCheckAndCreate = async () => {
     try {
        const values: FormValues = form.getFieldsValue();
-      const payload = {
-        ...values,
-        birthday_start: values.birthdayRange?.[0]?.format("YYYY-MM-DD"),
-        birthday_end: values.birthdayRange?.[1]?.format("YYYY-MM-DD"),
-        anniversary_start: values.anniversaryRange?.[0]?.format("YYYY-MM-DD"),
-        anniversary_end: values.anniversaryRange?.[1]?.format("YYYY-MM-DD"),
-      };
+      const payload = buildCountPayload(values);
 
       const res = await axios.post("/api/campaign/run/count", payload);
-      const { total_customers, shortlisted_customers } = res.data;
+      const { total_customers, shortlisted_customers, estimated, low, high } = res.data;
       Modal.confirm({
         title: "Confirm Campaign Creation",
         content: (
@@ -549,7 +621,10 @@ const CreateCampaign: React.FC = () => {
               <strong>Total Customers:</strong> {total_customers}
             </p>
             <p>
-              <strong>Shortlisted Customers:</strong> {shortlisted_customers}
+              <strong>Shortlisted Customers:</strong>{" "}
+              {estimated
+                ? `≈ ${shortlisted_customers} (${low}–${high}, estimated from a sample)`
+                : shortlisted_customers}
             </p>
             <p>Do you want to proceed with creating the campaign?</p>
           </div>
@@ -630,6 +705,7 @@ const CreateCampaign: React.FC = () => {
         form={form}
         layout="vertical"
         onFinish={onFinish}
+        onValuesChange={(_, allValues) => pushLiveFilters(allValues)}
         style={{ maxWidth: 1360, margin: "0 auto" }}
       >
         <Row gutter={8}>
@@ -1188,6 +1264,12 @@ const CreateCampaign: React.FC = () => {
             <Button type="primary" size="large" onClick={handleCheckAndCreate}>
               {isEditing ? "Update Campaign" : "Check and Create Campaign"}
             </Button>
+            {liveCount && (
+              <Text type="secondary">
+                Audience: {liveCount.estimated ? "≈ " : ""}
+                {liveCount.shortlisted_customers} of {liveCount.total_customers} customers
+              </Text>
+            )}
           </Space>
         </Form.Item>
       </Form>
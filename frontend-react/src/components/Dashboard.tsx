@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from "react";
+import React, { useState, useEffect, useCallback, useRef } from "react";
 import { DatePicker, Select, Button } from "antd";
 import dayjs, { Dayjs } from "dayjs";
 import axios from "axios";
@@ -58,18 +58,25 @@ const M_LABELS: Record<number, string> = {
 };
 
 // ---------- Types ----------
-interface DashboardRow {
-  R_SCORE: number;
-  F_SCORE: number;
-  M_SCORE: number;
-  R_VALUE?: number;
-  F_VALUE?: number;
-  M_VALUE?: number;
-  GROSS_PROFIT?: number;
-  NO_OF_ITEMS?: number;
-  DAYS?: number;
+// aggregates from /api/dashboard/metrics; count maps are keyed by value or bucket label
+interface DashboardMetrics {
+  customers: number;
+  items: number;
+  transactions: number;
+  spending: number;
+  days: number;
+  returning_customers: number;
+  r_scores: Record<string, number>;
+  f_scores: Record<string, number>;
+  m_scores: Record<string, number>;
+  visits: Record<string, number>;
+  r_value_buckets: Record<string, number>;
+  m_value_buckets: Record<string, number>;
 }
 
+const R_VALUE_BUCKETS = ["1-200", "200-400", "400-600", "600-800", "800-1000", ">1000"];
+const M_VALUE_BUCKETS = ["1-1000", "1000-2000", "2000-3000", "3000-4000", "4000-5000", ">5000"];
+
 interface ChartItem {
   name: string;
   value: number;
@@ -237,15 +244,11 @@ const Dashboard: React.FC = () => {
       try {
         const res = await axios.get("/api/filters");
         const {
-          phones: phoneList = [],
-          names: nameList = [],
           r_values: rList = [],
           f_values: fList = [],
           m_values: mList = [],
         } = res.data || {};
 
-        setPhones(phoneList);
-        setNames(nameList);
         setRValues(rList);
         setFValues(fList);
         setMValues(mList);
@@ -256,43 +259,40 @@ const Dashboard: React.FC = () => {
     fetchOptions();
   }, []);
 
-  // ---------- Utility ----------
-  const countBy = (rows: DashboardRow[], key: keyof DashboardRow) => {
-    const counts: Record<string, number> = {};
-    rows.forEach((r) => {
-      const val = r[key];
-      if (val !== undefined && val !== null) {
-        const strVal = String(val);
-        counts[strVal] = (counts[strVal] || 0) + 1;
+  // ---------- Typeahead (phone / name) ----------
+  const searchTimers = useRef<Record<string, ReturnType<typeof setTimeout>>>({});
+  const searchOptions = useCallback((key: "phone" | "name", q: string) => {
+    clearTimeout(searchTimers.current[key]);
+    searchTimers.current[key] = setTimeout(async () => {
+      try {
+        const endpoint = key === "phone" ? "phones" : "names";
+        const res = await axios.get(`/api/filters/${endpoint}`, { params: { q, limit: 50 } });
+        (key === "phone" ? setPhones : setNames)(res.data || []);
+      } catch (err) {
+        console.error(`Failed to search ${key}`, err);
       }
-    });
-    return counts;
-  };
+    }, 250);
+  }, []);
 
+  // ---------- Utility ----------
   const objectEntriesToArray = (obj: Record<string, number>, keyName: string): BarItem[] =>
     Object.entries(obj).map(([key, value]) => ({ [keyName]: key, value }));
 
+  // every bucket in order, including empty ones
+  const bucketsInOrder = (labels: string[], counts: Record<string, number>) =>
+    Object.fromEntries(labels.map((label) => [label, counts[label] || 0]));
+
   // ---------- Compute Metrics ----------
-  const computeMetrics = (rows: DashboardRow[]) => {
-    if (!rows?.length) return;
-
-    const totalCustomers = rows.length;
-    const totalItems = rows.reduce((sum, r) => sum + (r.NO_OF_ITEMS || 0), 0);
-    const totalTransactions = rows.reduce((sum, r) => sum + (r.F_VALUE || 0), 0);
-
-    const unitsPerTxn = totalTransactions ? +(totalItems / totalTransactions).toFixed(2) : 0;
-    const profitPerCustomer = totalCustomers
-      ? +(rows.reduce((s, r) => s + (r.GROSS_PROFIT || 0), 0) / totalCustomers).toFixed(2)
-      : 0;
-    const customerSpending = totalCustomers
-      ? +(rows.reduce((s, r) => s + (r.M_VALUE || 0), 0) / totalCustomers).toFixed(2)
-      : 0;
-    const daysToReturn = totalCustomers
-      ? +(rows.reduce((s, r) => s + (r.DAYS || 0), 0) / totalCustomers).toFixed(2)
-      : 0;
-    const retentionRate = totalCustomers
-      ? +((rows.filter((r) => (r.F_VALUE || 0) > 1).length / totalCustomers) * 100).toFixed(2)
-      : 0;
+  const computeMetrics = (m: DashboardMetrics) => {
+    if (!m?.customers) return;
+
+    const totalCustomers = m.customers;
+    const unitsPerTxn = m.transactions ? +(m.items / m.transactions).toFixed(2) : 0;
+    // crm_analysis has no GROSS_PROFIT column
+    const profitPerCustomer = 0;
+    const customerSpending = +(m.spending / totalCustomers).toFixed(2);
+    const daysToReturn = +(m.days / totalCustomers).toFixed(2);
+    const retentionRate = +((m.returning_customers / totalCustomers) * 100).toFixed(2);
 
     setMetricData({
       totalCustomers,
@@ -312,60 +312,14 @@ const Dashboard: React.FC = () => {
           value: counts[String(score)],
         }));
 
-    setPieDataR(makePieData(countBy(rows, "R_SCORE"), R_LABELS));
-    setPieDataF(makePieData(countBy(rows, "F_SCORE"), F_LABELS));
-    setPieDataM(makePieData(countBy(rows, "M_SCORE"), M_LABELS));
+    setPieDataR(makePieData(m.r_scores, R_LABELS));
+    setPieDataF(makePieData(m.f_scores, F_LABELS));
+    setPieDataM(makePieData(m.m_scores, M_LABELS));
 
     // ---------- Bar chart buckets ----------
-    const rBuckets: Record<string, number> = {
-      "1-200": 0,
-      "200-400": 0,
-      "400-600": 0,
-      "600-800": 0,
-      "800-1000": 0,
-      ">1000": 0,
-    };
-
-    rows.forEach(({ R_VALUE }) => {
-      const v = R_VALUE || 0;
-      if (v <= 200) rBuckets["1-200"]++;
-      else if (v <= 400) rBuckets["200-400"]++;
-      else if (v <= 600) rBuckets["400-600"]++;
-      else if (v <= 800) rBuckets["600-800"]++;
-      else if (v <= 1000) rBuckets["800-1000"]++;
-      else rBuckets[">1000"]++;
-    });
-
-    setBarDataR(objectEntriesToArray(rBuckets, "bucket"));
-
-    const visitsCounts: Record<string, number> = {};
-    rows.forEach(({ F_VALUE }) => {
-      const v = F_VALUE || 0;
-      visitsCounts[v] = (visitsCounts[v] || 0) + 1;
-    });
-
-    setBarDataVisits(objectEntriesToArray(visitsCounts, "visits"));
-
-    const valueBuckets: Record<string, number> = {
-      "1-1000": 0,
-      "1000-2000": 0,
-      "2000-3000": 0,
-      "3000-4000": 0,
-      "4000-5000": 0,
-      ">5000": 0,
-    };
-
-    rows.forEach(({ M_VALUE }) => {
-      const v = M_VALUE || 0;
-      if (v <= 1000) valueBuckets["1-1000"]++;
-      else if (v <= 2000) valueBuckets["1000-2000"]++;
-      else if (v <= 3000) valueBuckets["2000-3000"]++;
-      else if (v <= 4000) valueBuckets["3000-4000"]++;
-      else if (v <= 5000) valueBuckets["4000-5000"]++;
-      else valueBuckets[">5000"]++;
-    });
-
-    setBarDataValue(objectEntriesToArray(valueBuckets, "range"));
+    setBarDataR(objectEntriesToArray(bucketsInOrder(R_VALUE_BUCKETS, m.r_value_buckets), "bucket"));
+    setBarDataVisits(objectEntriesToArray(m.visits, "visits"));
+    setBarDataValue(objectEntriesToArray(bucketsInOrder(M_VALUE_BUCKETS, m.m_value_buckets), "range"));
   };
 
   // ---------- Apply Filters ----------
@@ -382,12 +336,12 @@ const Dashboard: React.FC = () => {
     }
 
     try {
-      const [res, chartsRes] = await Promise.all([
-        axios.get<DashboardRow[]>("/api/dashboard/", { params }),
+      const [metricsRes, chartsRes] = await Promise.all([
+        axios.get<DashboardMetrics>("/api/dashboard/metrics", { params }),
         axios.get("/api/dashboard/last_three_charts", { params }),
       ]);
 
-      computeMetrics(res.data);
+      computeMetrics(metricsRes.data);
        const segments: SegmentItem[] = (chartsRes.data.segmentData || []).map(
         (item: { name: string; value: number }, index: number) => ({
           ...item,
@@ -430,6 +384,14 @@ const Dashboard: React.FC = () => {
               className="filter-select"
               value={filters[key as keyof Filters]}
               onChange={(value) => setFilters((prev) => ({ ...prev, [key]: value }))}
+              {...(key === "phone" || key === "name"
+                ? {
+                    showSearch: true,
+                    filterOption: false,
+                    onSearch: (q: string) => searchOptions(key as "phone" | "name", q),
+                    onFocus: () => searchOptions(key as "phone" | "name", ""),
+                  }
+                : {})}
             >
               <Option value="">All</Option>
               {list.map((v) => (
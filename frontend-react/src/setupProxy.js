@@ -7,6 +7,7 @@ module.exports = function(app) {
     createProxyMiddleware({
       target: 'http://127.0.0.1:4001',
       changeOrigin: true,
+      ws: true, // live audience count socket
     })
   );
 };